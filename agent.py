@@ -1,11 +1,26 @@
-from langchain.agents import AgentType, initialize_agent
-from langchain.tools import tool
-from langchain_google_genai import ChatGoogleGenerativeAI
 import requests
+import httpx
 import os
+import re
+import json
+import asyncio
 import logging
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Optional
 from dotenv import load_dotenv
+from cache import SQLiteTTLCache, TTLCache, geohash_encode
+from tiles import TileIndex
+from prefilter import PlacePrefilter
+from quota import PLACES, QuotaTimeout, current_priority, get_scheduler
+from metrics import (
+    make_llm_callback, stage_timer, PLACES_REQUESTS, FALLBACK_REMINDERS, COALESCED_REQUESTS, TILE_INDEX_LOOKUPS,
+    PREFILTER_DECISIONS
+)
+from resilience import (
+    CircuitBreaker, CircuitOpenError, Deadline, DeadlineExceeded,
+    current_deadline, hedged, make_breaker_callback, reset_deadline, set_deadline
+)
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -14,11 +29,31 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 
+# Overridable so benchmarks and local testing can point at a stub Places server
+PLACES_NEARBY_URL = os.getenv("PLACES_API_URL", "https://maps.googleapis.com/maps/api/place/nearbysearch/json")
+
+# Processing modes: the ReAct agent loop, or a direct lookup followed by a single LLM call
+AGENT_MODE = "agent"
+PIPELINE_MODE = "pipeline"
+MODES = (AGENT_MODE, PIPELINE_MODE)
+
+# A call that timed out with this little of the request deadline left was cut off by the deadline
+DEADLINE_CUTOFF_SLACK_SECONDS = 0.1
+
 class PhotoReminderAgent:
     """Agent that generates photo reminders based on location context."""
     
-    def __init__(self, verbose: bool = True):
-        """Initialize the Photo Reminder Agent with LangChain components."""
+    def __init__(self, verbose: bool = True, place_cache: Optional[TTLCache] = None,
+                 mode: Optional[str] = None, reminder_cache: Optional[TTLCache] = None,
+                 llm=None, tile_index: Optional[TileIndex] = None):
+        """Initialize the Photo Reminder Agent with LangChain components.
+        
+        Any LangChain chat model can be passed as llm in place of Gemini, e.g. for benchmarks.
+        """
+        self.mode = mode or os.getenv("PHOTO_AGENT_MODE", AGENT_MODE)
+        if self.mode not in MODES:
+            raise ValueError(f"Unknown processing mode '{self.mode}', expected one of {MODES}")
+        
         # Check for API keys
         if not os.getenv("GOOGLE_API_KEY"):
             logger.error("GOOGLE_API_KEY environment variable is not set")
@@ -27,31 +62,108 @@ class PhotoReminderAgent:
             logger.error("PLACES_API_KEY environment variable is not set")
             raise EnvironmentError("PLACES_API_KEY environment variable is not set")
         
-        try:
-            # Initialize the Google Gemini model
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-2.0-flash",
-                google_api_key=os.getenv("GOOGLE_API_KEY")
-            )
-            logger.info("Successfully initialized Google Gemini model")
-        except Exception as e:
-            logger.error(f"Failed to initialize Google Gemini model: {str(e)}")
-            raise
+        # Cache resolved places per geohash cell so nearby coordinates skip the Places API
+        self.geohash_precision = int(os.getenv("PLACE_CACHE_PRECISION", "8"))
+        self.place_cache = place_cache or TTLCache(
+            maxsize=int(os.getenv("PLACE_CACHE_SIZE", "2048")),
+            ttl=float(os.getenv("PLACE_CACHE_TTL", "86400")),
+            name="places"
+        )
+        
+        # Memoize generated reminders and decisions per place and preference set;
+        # with a path they live in SQLite, kept across restarts and shared between workers
+        reminder_cache_path = os.getenv("REMINDER_CACHE_PATH")
+        reminder_cache_size = int(os.getenv("REMINDER_CACHE_SIZE", "4096"))
+        reminder_cache_ttl = float(os.getenv("REMINDER_CACHE_TTL", "604800"))
+        if reminder_cache is None and reminder_cache_path:
+            reminder_cache = SQLiteTTLCache(reminder_cache_path, maxsize=reminder_cache_size,
+                                            ttl=reminder_cache_ttl, name="reminders")
+        elif reminder_cache is None:
+            reminder_cache = TTLCache(maxsize=reminder_cache_size, ttl=reminder_cache_ttl, name="reminders")
+        self.reminder_cache = reminder_cache
         
+        # Decisions precomputed by prewarm.py answer matching requests without any upstream call
+        self.tile_index = tile_index
+        tile_index_path = os.getenv("TILE_INDEX_PATH")
+        if self.tile_index is None and tile_index_path:
+            if os.path.exists(tile_index_path):
+                max_age = float(os.getenv("TILE_INDEX_MAX_AGE", "2592000"))
+                self.tile_index = TileIndex(tile_index_path, max_age=max_age).load()
+            else:
+                logger.warning(f"Tile index {tile_index_path} not found, run prewarm.py to build it")
+        
+        # Clear-cut place types are decided by rules, so only ambiguous places reach the LLM
+        self.prefilter = PlacePrefilter.from_env()
+        
+        if llm is not None:
+            self.llm = llm
+        else:
+            try:
+                # Initialize the Google Gemini model (imported here to keep module import cheap)
+                from langchain_google_genai import ChatGoogleGenerativeAI
+                self.llm = ChatGoogleGenerativeAI(
+                    model="gemini-2.0-flash",
+                    google_api_key=os.getenv("GOOGLE_API_KEY")
+                )
+                logger.info("Successfully initialized Google Gemini model")
+            except Exception as e:
+                logger.error(f"Failed to initialize Google Gemini model: {str(e)}")
+                raise
+        
+        # Concurrent evaluations of the same place cell and preferences share one run
+        self.coalesce_requests = os.getenv("COALESCE_REQUESTS", "true").lower() in ("1", "true", "yes")
+        self._inflight: Dict[str, Any] = {}
+        self._inflight_lock = threading.Lock()
+        
+        # Every request gets a time budget; breakers fail fast while Places or Gemini is down
+        self.request_deadline = float(os.getenv("REQUEST_DEADLINE_SECONDS", "8"))
+        self.places_timeout = float(os.getenv("PLACES_TIMEOUT_SECONDS", "5"))
+        self.hedge_after = float(os.getenv("HEDGE_AFTER_SECONDS", "0")) or None
+        breaker_threshold = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+        breaker_reset = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+        self.places_breaker = CircuitBreaker("places", breaker_threshold, breaker_reset)
+        self.llm_breaker = CircuitBreaker("gemini", breaker_threshold, breaker_reset)
+        # Agent runs report each of their LLM calls, so tool or deadline failures don't trip the Gemini breaker
+        self.breaker_callback = make_breaker_callback(self.llm_breaker)
+        
+        # Time and count every LLM call, whether it comes from the agent loop, a tool or the pipeline
+        self.metrics_callback = make_llm_callback()
+        self.llm.callbacks = list(self.llm.callbacks or []) + [self.metrics_callback]
+        
+        # Gemini and Places calls queue for the process-wide quota, interactive requests first
+        self.quota = get_scheduler()
+        self.quota.attach(self.llm)
+        
+        # The agent executor is only needed in agent mode, so pipeline-only instances skip building it
+        self.verbose = verbose
+        self._agent = None
+        if self.mode == AGENT_MODE:
+            self._agent = self._build_agent()
+    
+    def _build_agent(self):
+        """Initialize the LangChain agent with our tools."""
+        from langchain.agents import AgentType, initialize_agent
         try:
-            # Initialize the LangChain agent with our tools
-            self.agent = initialize_agent(
+            agent = initialize_agent(
                 tools=self.tools,
                 llm=self.llm,
                 agent=AgentType.STRUCTURED_CHAT_ZERO_SHOT_REACT_DESCRIPTION,
-                verbose=verbose,
+                verbose=self.verbose,
                 handle_parsing_errors=True
             )
             logger.info("Successfully initialized LangChain agent")
+            return agent
         except Exception as e:
             logger.error(f"Failed to initialize LangChain agent: {str(e)}")
             raise
     
+    @property
+    def agent(self):
+        """Return the LangChain agent executor, building it on first use."""
+        if self._agent is None:
+            self._agent = self._build_agent()
+        return self._agent
+    
     @property
     def tools(self) -> List:
         """Return the list of tools available to the agent."""
@@ -60,54 +172,230 @@ class PhotoReminderAgent:
             self.generate_reminder_tool()
         ]
     
+    def cache_stats(self) -> Dict[str, Any]:
+        """Return hit/miss statistics for the agent's caches."""
+        return {
+            "places": self.place_cache.stats(),
+            "reminders": self.reminder_cache.stats()
+        }
+    
+    def tile_index_stats(self) -> Dict[str, Any]:
+        """Return the tile index size and hit counters, or an empty dict without an index."""
+        return self.tile_index.stats() if self.tile_index is not None else {}
+    
+    def _tile_index_result(self, lat: float, lng: float, preferences: List[str]) -> Optional[Dict[str, Any]]:
+        """Answer from the precomputed tile index, or return None on a miss."""
+        if self.tile_index is None:
+            return None
+        decision = self.tile_index.lookup(lat, lng, preferences)
+        TILE_INDEX_LOOKUPS.inc(result="miss" if decision is None else "hit")
+        if decision is None:
+            return None
+        logger.info(f"Tile index hit for {lat}, {lng}")
+        return self._build_result(lat, lng, decision["worthy"], decision["message"])
+    
+    def prefilter_stats(self) -> Dict[str, Any]:
+        """Return the prefilter verdict counts and LLM calls avoided, or an empty dict when it is off."""
+        return self.prefilter.stats() if self.prefilter is not None else {}
+    
+    def _prefilter_decision(self, place_info: Dict[str, Any], preferences: List[str]) -> Optional[Dict[str, Any]]:
+        """Return the rule-based {worthy, message} decision for a place, or None if the LLM must decide."""
+        if self.prefilter is None or "error" in place_info:
+            return None
+        decision = self.prefilter.decide(place_info, preferences)
+        if decision is None:
+            PREFILTER_DECISIONS.inc(verdict="ambiguous")
+        else:
+            PREFILTER_DECISIONS.inc(verdict="accept" if decision["worthy"] else "reject")
+        return decision
+    
+    def breaker_stats(self) -> Dict[str, Any]:
+        """Return the state of the upstream circuit breakers."""
+        return {
+            "places": self.places_breaker.stats(),
+            "gemini": self.llm_breaker.stats()
+        }
+    
+    @staticmethod
+    def _upstream_timeout(cap: Optional[float] = None) -> Optional[float]:
+        """Return the timeout for the next upstream call, raising DeadlineExceeded if the budget is spent."""
+        deadline = current_deadline()
+        if deadline is None:
+            return cap
+        return deadline.timeout(cap)
+    
+    @staticmethod
+    def _cut_by_deadline() -> bool:
+        """Return True when a call that just timed out was limited by the request deadline, not its own timeout.
+        
+        Such a timeout says nothing about the upstream, so it must not count against its breaker.
+        """
+        deadline = current_deadline()
+        return deadline is not None and deadline.remaining() <= DEADLINE_CUTOFF_SLACK_SECONDS
+    
+    def coalesce_key(self, lat: float, lng: float, preferences: List[str], mode: str) -> str:
+        """Build the single-flight key for an evaluation: mode, place cell, preference set and priority class.
+        
+        A shared run queues for quota at its leader's priority, so interactive callers never join batch or prewarm runs.
+        """
+        return json.dumps([
+            current_priority(),
+            mode,
+            geohash_encode(lat, lng, self.geohash_precision),
+            sorted(p.strip().lower() for p in preferences)
+        ])
+    
+    @staticmethod
+    def _relocate(result: Dict[str, Any], lat: float, lng: float) -> Dict[str, Any]:
+        """Return a copy of a shared result that reports the caller's own coordinates."""
+        return {**result, "location": {"lat": lat, "lng": lng}}
+    
+    @staticmethod
+    def reminder_cache_key(kind: str, place_info: Dict[str, Any], preferences: List[str]) -> str:
+        """Build a cache key from the place identity and the normalized preference set."""
+        normalized_preferences = sorted({p.strip().lower() for p in preferences if p.strip()})
+        return json.dumps([
+            kind,
+            place_info.get("name"),
+            place_info.get("type"),
+            place_info.get("rating"),
+            bool(place_info.get("is_popular", False)),
+            normalized_preferences
+        ], ensure_ascii=False)
+    
+    def get_place_details(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        """Return place details for a coordinate, using the geohash cell cache when possible."""
+        cell, cached = self._cached_place(latitude, longitude)
+        if cached is not None:
+            return cached
+        
+        place_info = self._fetch_place_details(latitude, longitude)
+        self._store_place(cell, place_info)
+        return place_info
+    
+    def _cached_place(self, latitude: float, longitude: float):
+        """Return the coordinate's geohash cell and its cached place info, if any."""
+        cell = geohash_encode(latitude, longitude, self.geohash_precision)
+        cached = self.place_cache.get(cell)
+        if cached is not None:
+            logger.info(f"Place cache hit for cell {cell}: {cached['name']}")
+            return cell, dict(cached)
+        if self.tile_index is not None:
+            # A prewarmed place saves the Places call even when these preferences were not precomputed
+            indexed = self.tile_index.place(latitude, longitude)
+            if indexed is not None:
+                logger.info(f"Tile index place for cell {cell}: {indexed['name']}")
+                self.place_cache.set(cell, dict(indexed))
+                return cell, indexed
+        return cell, None
+    
+    def _store_place(self, cell: str, place_info: Dict[str, Any]) -> None:
+        """Cache a place lookup; failed lookups are skipped so transient API errors are retried."""
+        if "error" not in place_info:
+            self.place_cache.set(cell, dict(place_info))
+    
+    def _fetch_place_details(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        """Fetch detailed information about a coordinate from the Google Places API."""
+        logger.info(f"Fetching place details for coordinates: {latitude}, {longitude}")
+        skipped = self._skip_places_request()
+        if skipped is not None:
+            return skipped
+        try:
+            self.quota.acquire(PLACES)
+            with stage_timer("places_request"):
+                response = requests.get(
+                    PLACES_NEARBY_URL,
+                    params=self._places_params(latitude, longitude),
+                    timeout=self._upstream_timeout(self.places_timeout)
+                )
+            response.raise_for_status()
+            
+            place_info = self._parse_places_response(response.json())
+            self.places_breaker.record_success()
+            PLACES_REQUESTS.inc(result="ok")
+            logger.info(f"Successfully retrieved place info: {place_info['name']}")
+            return place_info
+        except DeadlineExceeded as e:
+            # Our own queue or deadline ran out of time, which says nothing about the health of Places
+            logger.warning(f"Skipping Places request: {str(e)}")
+            PLACES_REQUESTS.inc(result="skipped")
+            return {"error": str(e)}
+        except requests.exceptions.RequestException as e:
+            if isinstance(e, requests.exceptions.Timeout) and self._cut_by_deadline():
+                return self._deadline_cut_places()
+            error_msg = f"API request failed: {str(e)}"
+            logger.error(error_msg)
+            self.places_breaker.record_failure()
+            PLACES_REQUESTS.inc(result="error")
+            return {"error": error_msg}
+        except Exception as e:
+            error_msg = f"Failed to get place details: {str(e)}"
+            logger.error(error_msg)
+            self.places_breaker.record_failure()
+            PLACES_REQUESTS.inc(result="error")
+            return {"error": error_msg}
+    
+    @staticmethod
+    def _deadline_cut_places() -> Dict[str, Any]:
+        """Return the error result for a Places request the request deadline cut off."""
+        error_msg = "Places request cut off by the request deadline"
+        logger.warning(error_msg)
+        PLACES_REQUESTS.inc(result="skipped")
+        return {"error": error_msg}
+    
+    def _skip_places_request(self) -> Optional[Dict[str, Any]]:
+        """Return an error result without calling Places if its breaker is open or the deadline has passed."""
+        try:
+            self._upstream_timeout()
+            self.places_breaker.check()
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            logger.warning(f"Skipping Places request: {str(e)}")
+            PLACES_REQUESTS.inc(result="skipped")
+            return {"error": str(e)}
+        return None
+    
+    @staticmethod
+    def _places_params(latitude: float, longitude: float) -> Dict[str, Any]:
+        """Build the query parameters for a Places nearbysearch request."""
+        return {
+            "location": f"{latitude},{longitude}",
+            "radius": 50,  # Search within 50 meters of location
+            "key": os.getenv("PLACES_API_KEY")
+        }
+    
+    @staticmethod
+    def _parse_places_response(data: Dict[str, Any]) -> Dict[str, Any]:
+        """Extract the best match from a Places nearbysearch response."""
+        logger.debug(f"Places API response status: {data.get('status')}")
+        
+        results = data.get('results', [{}])
+        best_result = results[0] if results else {}
+        
+        # Extract relevant place information
+        return {
+            "type": best_result.get('types', ['unknown'])[0],
+            "name": best_result.get('name', 'current location'),
+            "address": best_result.get('vicinity', 'unknown location'),
+            "rating": best_result.get('rating', 0),
+            "is_popular": best_result.get('user_ratings_total', 0) > 100,
+            "types": best_result.get('types', [])
+        }
+    
     def get_place_details_tool(self):
         """Create a tool to fetch location details from Google Places API."""
+        from langchain.tools import tool
+        
         @tool
         def get_place_details(latitude: float, longitude: float) -> Dict[str, Any]:
             """Fetch detailed information about current location using Google Places API."""
-            logger.info(f"Fetching place details for coordinates: {latitude}, {longitude}")
-            try:
-                response = requests.get(
-                    "https://maps.googleapis.com/maps/api/place/nearbysearch/json",
-                    params={
-                        "location": f"{latitude},{longitude}",
-                        "radius": 50,  # Search within 50 meters of location
-                        "key": os.getenv("PLACES_API_KEY")
-                    },
-                    timeout=5
-                )
-                response.raise_for_status()
-                
-                data = response.json()
-                logger.debug(f"Places API response status: {data.get('status')}")
-                
-                results = data.get('results', [{}])
-                best_result = results[0] if results else {}
-                
-                # Extract relevant place information
-                place_info = {
-                    "type": best_result.get('types', ['unknown'])[0],
-                    "name": best_result.get('name', 'current location'),
-                    "address": best_result.get('vicinity', 'unknown location'),
-                    "rating": best_result.get('rating', 0),
-                    "is_popular": best_result.get('user_ratings_total', 0) > 100
-                }
-                
-                logger.info(f"Successfully retrieved place info: {place_info['name']}")
-                return place_info
-            except requests.exceptions.RequestException as e:
-                error_msg = f"API request failed: {str(e)}"
-                logger.error(error_msg)
-                return {"error": error_msg}
-            except Exception as e:
-                error_msg = f"Failed to get place details: {str(e)}"
-                logger.error(error_msg)
-                return {"error": error_msg}
+            return self.get_place_details(latitude, longitude)
         
         return get_place_details
     
     def generate_reminder_tool(self):
         """Create a tool to generate photo reminders based on place information."""
+        from langchain.tools import tool
+        
         @tool
         def generate_photo_reminder(place_info: Dict[str, Any], preferences: List[str]) -> str:
             """Generate a photo reminder message considering place details and user preferences."""
@@ -115,77 +403,499 @@ class PhotoReminderAgent:
             
             # Check if there was an error getting place info
             if "error" in place_info:
-                logger.warning(f"Using fallback reminder due to place info error: {place_info['error']}")
-                return "📸 Don't forget to capture this moment!"
+                return self._place_error_reminder(place_info)
             
-            prompt = f"""
-            Create a friendly photo reminder for this location:
-            
-            Name: {place_info.get('name')}
-            Type: {place_info.get('type')}
-            Address: {place_info.get('address')}
-            Rating: {place_info.get('rating')}
-            Is Popular: {place_info.get('is_popular', False)}
-            User Preferences: {', '.join(preferences)}
-            
-            Requirements:
-            - Include 1-2 relevant emojis that match the place type
-            - Max 15 words
-            - Friendly and encouraging tone
-            - Consider place type and user preferences
-            - If it's a highly-rated place, emphasize its quality
-            
-            Examples:
-            - "🌳 Don't miss the beautiful scenery at this park!"
-            - "🏛️ Capture this impressive museum architecture!"
-            - "☕ This coffee shop has perfect lighting for your food photos!"
-            """
+            cache_key = self.reminder_cache_key("reminder", place_info, preferences)
+            cached = self.reminder_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Reminder cache hit: {cached}")
+                return cached
             
             try:
-                response = self.llm.invoke(prompt).content
+                response = self._invoke_llm(self._reminder_prompt(place_info, preferences), "reminder")
                 logger.info(f"Successfully generated reminder: {response}")
+                self.reminder_cache.set(cache_key, response)
                 return response
             except Exception as e:
                 # Fallback reminder if LLM call fails
-                error_msg = f"Failed to generate reminder: {str(e)}"
-                logger.error(error_msg)
-                fallback = f"📸 Don't miss taking a photo at {place_info.get('name', 'this place')}!"
-                logger.info(f"Using fallback reminder: {fallback}")
-                return fallback
+                logger.error(f"Failed to generate reminder: {str(e)}")
+                return self._fallback_reminder(place_info, self._fallback_reason(e))
         
         return generate_photo_reminder
     
-    def process_location(self, lat: float, lng: float, preferences: List[str]) -> Dict[str, Any]:
-        """Process a location to determine if a photo reminder should be generated."""
-        logger.info(f"Processing location: {lat}, {lng} with preferences: {preferences}")
+    def _reminder_prompt(self, place_info: Dict[str, Any], preferences: List[str]) -> str:
+        """Build the prompt used by the generate_photo_reminder tool."""
+        return f"""
+        Create a friendly photo reminder for this location:
+        
+        Name: {place_info.get('name')}
+        Type: {place_info.get('type')}
+        Address: {place_info.get('address')}
+        Rating: {place_info.get('rating')}
+        Is Popular: {place_info.get('is_popular', False)}
+        User Preferences: {', '.join(preferences)}
+        
+        Requirements:
+        - Include 1-2 relevant emojis that match the place type
+        - Max 15 words
+        - Friendly and encouraging tone
+        - Consider place type and user preferences
+        - If it's a highly-rated place, emphasize its quality
+        
+        Examples:
+        - "🌳 Don't miss the beautiful scenery at this park!"
+        - "🏛️ Capture this impressive museum architecture!"
+        - "☕ This coffee shop has perfect lighting for your food photos!"
+        """
+    
+    @staticmethod
+    def _fallback_reminder(place_info: Dict[str, Any], reason: str = "llm_error") -> str:
+        """Return the reminder used when the LLM call fails or the request runs out of time."""
+        fallback = f"📸 Don't miss taking a photo at {place_info.get('name', 'this place')}!"
+        logger.info(f"Using fallback reminder ({reason}): {fallback}")
+        FALLBACK_REMINDERS.inc(reason=reason)
+        return fallback
+    
+    @staticmethod
+    def _fallback_reason(error: Exception) -> str:
+        """Classify an LLM failure for the fallback reminder counter."""
+        if isinstance(error, (DeadlineExceeded, asyncio.TimeoutError)):
+            return "deadline"
+        if isinstance(error, CircuitOpenError):
+            return "circuit_open"
+        return "llm_error"
+    
+    def _deadline_result(self, lat: float, lng: float, reason: str = "deadline") -> Dict[str, Any]:
+        """Return the fallback reminder for a request that cannot wait for the LLM, naming the place if known."""
+        place_info = self.place_cache.get(geohash_encode(lat, lng, self.geohash_precision)) or {}
+        return self._build_result(lat, lng, True, self._fallback_reminder(place_info, reason))
+    
+    def _invoke_llm(self, prompt: str, kind: str) -> str:
+        """Call the LLM through its circuit breaker, refusing to start once the deadline has passed.
+        
+        A blocking invoke cannot be interrupted, so the deadline is only checked before the call;
+        the async agent also cuts calls off mid-flight.
+        """
+        self._upstream_timeout()
+        self.llm_breaker.check()
+        try:
+            response = self.llm.invoke(prompt, config={"tags": [f"kind:{kind}"]}).content
+        except QuotaTimeout:
+            raise
+        except Exception:
+            self.llm_breaker.record_failure()
+            raise
+        self.llm_breaker.record_success()
+        return response
+    
+    @staticmethod
+    def _place_error_reminder(place_info: Dict[str, Any]) -> str:
+        """Return the generic reminder used when the place lookup failed."""
+        logger.warning(f"Using fallback reminder due to place info error: {place_info['error']}")
+        FALLBACK_REMINDERS.inc(reason="place_error")
+        return "📸 Don't forget to capture this moment!"
+    
+    def process_location(self, lat: float, lng: float, preferences: List[str],
+                         mode: Optional[str] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Process a location to determine if a photo reminder should be generated.
+        
+        Calls for the same place cell, preferences and mode that arrive while one is
+        running wait for it and share its result (disable with COALESCE_REQUESTS=false).
+        Upstream calls share the deadline, REQUEST_DEADLINE_SECONDS from now by default.
+        """
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown processing mode '{mode}', expected one of {MODES}")
+        deadline = deadline or Deadline(self.request_deadline)
+        
+        indexed = self._tile_index_result(lat, lng, preferences)
+        if indexed is not None:
+            return indexed
+        
+        if not self.coalesce_requests:
+            return self._process_location(lat, lng, preferences, mode, deadline)
+        
+        key = self.coalesce_key(lat, lng, preferences, mode)
+        with self._inflight_lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        
+        if not leader:
+            logger.info(f"Joining in-flight evaluation for {lat}, {lng} (mode: {mode})")
+            COALESCED_REQUESTS.inc()
+            try:
+                return self._relocate(future.result(timeout=deadline.remaining()), lat, lng)
+            except FutureTimeoutError:
+                return self._deadline_result(lat, lng)
+        
+        try:
+            result = self._process_location(lat, lng, preferences, mode, deadline)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+    
+    def _process_location(self, lat: float, lng: float, preferences: List[str], mode: str,
+                          deadline: Deadline) -> Dict[str, Any]:
+        """Run one evaluation in the given mode, turning failures into an error result."""
+        logger.info(f"Processing location: {lat}, {lng} with preferences: {preferences} (mode: {mode})")
+        token = set_deadline(deadline)
         try:
-            # Structure the input for the agent
-            agent_input = (
-                f"I am at coordinates {lat},{lng}. "
-                f"First, get details about this location. "
-                f"Then, decide if it's worth taking a photo here based on the location type and my preferences: {preferences}. "
-                f"If it is, generate a suitable photo reminder message."
+            with stage_timer(f"{mode}_run"):
+                if mode == PIPELINE_MODE:
+                    return self._run_pipeline(lat, lng, preferences)
+                return self._run_agent(lat, lng, preferences)
+        except Exception as e:
+            error_msg = f"Error processing location: {str(e)}"
+            logger.error(error_msg)
+            return {
+                "reminder": False,
+                "error": error_msg,
+                "location": {"lat": lat, "lng": lng}
+            }
+        finally:
+            reset_deadline(token)
+    
+    def _run_agent(self, lat: float, lng: float, preferences: List[str]) -> Dict[str, Any]:
+        """Let the ReAct agent look up the place and write the reminder, unless the prefilter already decided."""
+        if self.prefilter is not None:
+            # The lookup is cached per cell, so the agent's own place tool call does not repeat it
+            ruled = self._prefilter_decision(self.get_place_details(lat, lng), preferences)
+            if ruled is not None:
+                return self._build_result(lat, lng, ruled["worthy"], ruled["message"])
+        
+        if not self.llm_breaker.allow():
+            return self._deadline_result(lat, lng, reason="circuit_open")
+        
+        # Run the agent
+        logger.info("Running agent with location input")
+        try:
+            response = self.agent.run(
+                input=self._agent_input(lat, lng, preferences),
+                callbacks=[self.metrics_callback, self.breaker_callback]
+            )
+        except DeadlineExceeded:
+            # Raised when the agent's LLM calls waited for quota until the deadline
+            return self._deadline_result(lat, lng)
+        logger.info(f"Agent response: {response}")
+        return self._agent_result(lat, lng, response)
+    
+    @staticmethod
+    def _agent_input(lat: float, lng: float, preferences: List[str]) -> str:
+        """Structure the input for the agent."""
+        return (
+            f"I am at coordinates {lat},{lng}. "
+            f"First, get details about this location. "
+            f"Then, decide if it's worth taking a photo here based on the location type and my preferences: {preferences}. "
+            f"If it is, generate a suitable photo reminder message."
+        )
+    
+    def _agent_result(self, lat: float, lng: float, response: str) -> Dict[str, Any]:
+        """Turn a free-form agent answer into the process_location result."""
+        if "not worth" in response.lower() or "wouldn't recommend" in response.lower():
+            logger.info("Agent determined location is not photo-worthy")
+            return self._build_result(lat, lng, False, response)
+        
+        logger.info("Photo reminder generated successfully")
+        return self._build_result(lat, lng, True, response)
+    
+    def _run_pipeline(self, lat: float, lng: float, preferences: List[str]) -> Dict[str, Any]:
+        """Look up the place directly and decide with a single structured LLM call."""
+        place_info = self.get_place_details(lat, lng)
+        if "error" in place_info:
+            return self._place_error_result(lat, lng, place_info)
+        
+        try:
+            decision = self.decide(place_info, preferences)
+        except Exception as e:
+            logger.error(f"Failed to generate decision: {str(e)}")
+            return self._build_result(lat, lng, True, self._fallback_reminder(place_info, self._fallback_reason(e)))
+        
+        return self._build_result(lat, lng, decision["worthy"], decision["message"])
+    
+    def decide(self, place_info: Dict[str, Any], preferences: List[str]) -> Dict[str, Any]:
+        """Return the {worthy, message} decision for a place, from the prefilter, the cache or a single LLM call."""
+        ruled = self._prefilter_decision(place_info, preferences)
+        if ruled is not None:
+            return ruled
+        
+        cache_key = self.reminder_cache_key("decision", place_info, preferences)
+        cached = self.reminder_cache.get(cache_key)
+        if cached is not None:
+            logger.info(f"Decision cache hit for {place_info.get('name')}: {cached}")
+            return cached
+        
+        response = self._invoke_llm(self._decision_prompt(place_info, preferences), "decision")
+        decision = self._parse_decision(response)
+        logger.info(f"Pipeline decision for {place_info.get('name')}: {decision}")
+        self.reminder_cache.set(cache_key, decision)
+        return decision
+    
+    def _place_error_result(self, lat: float, lng: float, place_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the generic reminder result used when the place lookup failed."""
+        return self._build_result(lat, lng, True, self._place_error_reminder(place_info))
+    
+    def _decision_prompt(self, place_info: Dict[str, Any], preferences: List[str]) -> str:
+        """Build the single-call prompt that decides worthiness and writes the reminder."""
+        return f"""
+        Decide if this location is worth taking a photo at, and if so write a friendly photo reminder:
+        
+        Name: {place_info.get('name')}
+        Type: {place_info.get('type')}
+        Address: {place_info.get('address')}
+        Rating: {place_info.get('rating')}
+        Is Popular: {place_info.get('is_popular', False)}
+        User Preferences: {', '.join(preferences)}
+        
+        Requirements for the reminder message:
+        - Include 1-2 relevant emojis that match the place type
+        - Max 15 words
+        - Friendly and encouraging tone
+        - Consider place type and user preferences
+        - If it's a highly-rated place, emphasize its quality
+        
+        If the place is not worth a photo, the message should briefly explain why.
+        
+        Respond with ONLY a JSON object, no other text:
+        {{"worthy": true or false, "message": "..."}}
+        """
+    
+    @staticmethod
+    def _parse_decision(response: str) -> Dict[str, Any]:
+        """Parse the structured {worthy, message} reply, tolerating code fences and extra text."""
+        match = re.search(r"\{.*\}", response, re.DOTALL)
+        if match:
+            try:
+                data = json.loads(match.group(0))
+                if isinstance(data, dict) and "worthy" in data:
+                    worthy = data["worthy"]
+                    if isinstance(worthy, str):
+                        worthy = worthy.strip().lower() in ("true", "yes", "1")
+                    return {"worthy": bool(worthy), "message": str(data.get("message", "")).strip()}
+            except json.JSONDecodeError:
+                pass
+        
+        # Fall back to the same phrase check used for free-form agent answers
+        logger.warning(f"Could not parse structured decision, falling back to text check: {response}")
+        lowered = response.lower()
+        worthy = not ("not worth" in lowered or "wouldn't recommend" in lowered)
+        return {"worthy": worthy, "message": response.strip()}
+    
+    @staticmethod
+    def _build_result(lat: float, lng: float, worthy: bool, message: str) -> Dict[str, Any]:
+        """Build the process_location return value."""
+        if not worthy:
+            return {
+                "reminder": False,
+                "message": message
+            }
+        return {
+            "reminder": True,
+            "message": message,
+            "location": {"lat": lat, "lng": lng}
+        }
+
+
+class AsyncPhotoReminderAgent(PhotoReminderAgent):
+    """Non-blocking PhotoReminderAgent for use inside an asyncio event loop.
+    
+    Places lookups go through a pooled httpx.AsyncClient and LLM calls use
+    ainvoke, so a slow upstream only suspends the request that is waiting on it.
+    """
+    
+    def __init__(self, verbose: bool = True, place_cache: Optional[TTLCache] = None,
+                 mode: Optional[str] = None, reminder_cache: Optional[TTLCache] = None,
+                 llm=None, max_connections: int = 100, tile_index: Optional[TileIndex] = None):
+        """Initialize the agent and its shared async HTTP client."""
+        self.http_client = httpx.AsyncClient(
+            timeout=5,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=20)
+        )
+        super().__init__(verbose=verbose, place_cache=place_cache, mode=mode,
+                         reminder_cache=reminder_cache, llm=llm, tile_index=tile_index)
+    
+    async def aclose(self) -> None:
+        """Close the pooled HTTP client."""
+        await self.http_client.aclose()
+    
+    async def _reminder_cache_call(self, method, *args) -> Any:
+        """Call a reminder cache method, in a thread unless the cache is in-memory, so disk waits don't block the loop."""
+        if isinstance(self.reminder_cache, TTLCache):
+            return method(*args)
+        return await asyncio.to_thread(method, *args)
+    
+    async def _ainvoke_llm(self, prompt: str, kind: str) -> str:
+        """Call the LLM through its circuit breaker, cut off at the request deadline and optionally hedged."""
+        timeout = self._upstream_timeout()
+        self.llm_breaker.check()
+        try:
+            message = await asyncio.wait_for(
+                hedged(lambda: self.llm.ainvoke(prompt, config={"tags": [f"kind:{kind}"]}), self.hedge_after),
+                timeout=timeout
             )
+        except QuotaTimeout:
+            raise
+        except Exception as e:
+            if not (isinstance(e, asyncio.TimeoutError) and self._cut_by_deadline()):
+                self.llm_breaker.record_failure()
+            raise
+        self.llm_breaker.record_success()
+        return message.content
+    
+    async def get_place_details(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        """Return place details for a coordinate, using the geohash cell cache when possible."""
+        cell, cached = self._cached_place(latitude, longitude)
+        if cached is not None:
+            return cached
+        
+        place_info = await self._fetch_place_details(latitude, longitude)
+        self._store_place(cell, place_info)
+        return place_info
+    
+    async def _fetch_place_details(self, latitude: float, longitude: float) -> Dict[str, Any]:
+        """Fetch detailed information about a coordinate from the Google Places API."""
+        logger.info(f"Fetching place details for coordinates: {latitude}, {longitude}")
+        skipped = self._skip_places_request()
+        if skipped is not None:
+            return skipped
+        try:
+            async def attempt():
+                # Every attempt, including a hedge, counts against the Places quota
+                await self.quota.aacquire(PLACES)
+                # Taken after the quota wait, so the request never outlives the deadline
+                return await self.http_client.get(
+                    PLACES_NEARBY_URL,
+                    params=self._places_params(latitude, longitude),
+                    timeout=self._upstream_timeout(self.places_timeout)
+                )
+            
+            with stage_timer("places_request"):
+                response = await hedged(attempt, self.hedge_after)
+            response.raise_for_status()
+            
+            place_info = self._parse_places_response(response.json())
+            self.places_breaker.record_success()
+            PLACES_REQUESTS.inc(result="ok")
+            logger.info(f"Successfully retrieved place info: {place_info['name']}")
+            return place_info
+        except DeadlineExceeded as e:
+            # Our own queue or deadline ran out of time, which says nothing about the health of Places
+            logger.warning(f"Skipping Places request: {str(e)}")
+            PLACES_REQUESTS.inc(result="skipped")
+            return {"error": str(e)}
+        except httpx.HTTPError as e:
+            if isinstance(e, httpx.TimeoutException) and self._cut_by_deadline():
+                return self._deadline_cut_places()
+            error_msg = f"API request failed: {str(e)}"
+            logger.error(error_msg)
+            self.places_breaker.record_failure()
+            PLACES_REQUESTS.inc(result="error")
+            return {"error": error_msg}
+        except Exception as e:
+            error_msg = f"Failed to get place details: {str(e)}"
+            logger.error(error_msg)
+            self.places_breaker.record_failure()
+            PLACES_REQUESTS.inc(result="error")
+            return {"error": error_msg}
+    
+    def get_place_details_tool(self):
+        """Create an async tool to fetch location details from Google Places API."""
+        from langchain.tools import tool
+        
+        @tool
+        async def get_place_details(latitude: float, longitude: float) -> Dict[str, Any]:
+            """Fetch detailed information about current location using Google Places API."""
+            return await self.get_place_details(latitude, longitude)
+        
+        return get_place_details
+    
+    def generate_reminder_tool(self):
+        """Create an async tool to generate photo reminders based on place information."""
+        from langchain.tools import tool
+        
+        @tool
+        async def generate_photo_reminder(place_info: Dict[str, Any], preferences: List[str]) -> str:
+            """Generate a photo reminder message considering place details and user preferences."""
+            logger.info(f"Generating photo reminder for place: {place_info.get('name', 'unknown')}")
             
-            # Run the agent
-            logger.info("Running agent with location input")
-            response = self.agent.run(input=agent_input)
-            logger.info(f"Agent response: {response}")
+            # Check if there was an error getting place info
+            if "error" in place_info:
+                return self._place_error_reminder(place_info)
             
-            # Process the response
-            if "not worth" in response.lower() or "wouldn't recommend" in response.lower():
-                logger.info("Agent determined location is not photo-worthy")
-                return {
-                    "reminder": False,
-                    "message": response
-                }
+            cache_key = self.reminder_cache_key("reminder", place_info, preferences)
+            cached = await self._reminder_cache_call(self.reminder_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"Reminder cache hit: {cached}")
+                return cached
             
-            logger.info("Photo reminder generated successfully")
-            return {
-                "reminder": True,
-                "message": response,
-                "location": {"lat": lat, "lng": lng}
-            }
+            try:
+                response = await self._ainvoke_llm(self._reminder_prompt(place_info, preferences), "reminder")
+                logger.info(f"Successfully generated reminder: {response}")
+                await self._reminder_cache_call(self.reminder_cache.set, cache_key, response)
+                return response
+            except Exception as e:
+                # Fallback reminder if LLM call fails
+                logger.error(f"Failed to generate reminder: {str(e)}")
+                return self._fallback_reminder(place_info, self._fallback_reason(e))
+        
+        return generate_photo_reminder
+    
+    async def process_location(self, lat: float, lng: float, preferences: List[str],
+                               mode: Optional[str] = None, deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """Process a location to determine if a photo reminder should be generated.
+        
+        Calls for the same place cell, preferences and mode that arrive while one is
+        running wait for it and share its result (disable with COALESCE_REQUESTS=false).
+        Upstream calls are cut off at the deadline, REQUEST_DEADLINE_SECONDS from now by
+        default, and the request falls back to the generic reminder.
+        """
+        mode = mode or self.mode
+        if mode not in MODES:
+            raise ValueError(f"Unknown processing mode '{mode}', expected one of {MODES}")
+        deadline = deadline or Deadline(self.request_deadline)
+        
+        indexed = self._tile_index_result(lat, lng, preferences)
+        if indexed is not None:
+            return indexed
+        
+        if not self.coalesce_requests:
+            return await self._process_location(lat, lng, preferences, mode, deadline)
+        
+        key = self.coalesce_key(lat, lng, preferences, mode)
+        task = self._inflight.get(key)
+        if task is not None:
+            logger.info(f"Joining in-flight evaluation for {lat}, {lng} (mode: {mode})")
+            COALESCED_REQUESTS.inc()
+            try:
+                # Joiners keep their own deadline even if the shared run was started with a longer one
+                return self._relocate(await asyncio.wait_for(asyncio.shield(task), deadline.remaining()), lat, lng)
+            except asyncio.TimeoutError:
+                return self._deadline_result(lat, lng)
+        
+        task = asyncio.ensure_future(self._process_location(lat, lng, preferences, mode, deadline))
+        self._inflight[key] = task
+        task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded so a caller that disconnects does not cancel the run for everyone waiting on it
+        return await asyncio.shield(task)
+    
+    async def _process_location(self, lat: float, lng: float, preferences: List[str], mode: str,
+                                deadline: Deadline) -> Dict[str, Any]:
+        """Run one evaluation in the given mode, turning failures into an error result."""
+        logger.info(f"Processing location: {lat}, {lng} with preferences: {preferences} (mode: {mode})")
+        token = set_deadline(deadline)
+        try:
+            with stage_timer(f"{mode}_run"):
+                if mode == PIPELINE_MODE:
+                    return await self._run_pipeline(lat, lng, preferences)
+                return await self._run_agent(lat, lng, preferences)
         except Exception as e:
             error_msg = f"Error processing location: {str(e)}"
             logger.error(error_msg)
@@ -193,4 +903,65 @@ class PhotoReminderAgent:
                 "reminder": False,
                 "error": error_msg,
                 "location": {"lat": lat, "lng": lng}
-            }
\ No newline at end of file
+            }
+        finally:
+            reset_deadline(token)
+    
+    async def _run_agent(self, lat: float, lng: float, preferences: List[str]) -> Dict[str, Any]:
+        """Let the ReAct agent look up the place and write the reminder, unless the prefilter already decided."""
+        if self.prefilter is not None:
+            # The lookup is cached per cell, so the agent's own place tool call does not repeat it
+            ruled = self._prefilter_decision(await self.get_place_details(lat, lng), preferences)
+            if ruled is not None:
+                return self._build_result(lat, lng, ruled["worthy"], ruled["message"])
+        
+        if not self.llm_breaker.allow():
+            return self._deadline_result(lat, lng, reason="circuit_open")
+        
+        logger.info("Running agent with location input")
+        try:
+            result = await asyncio.wait_for(
+                self.agent.ainvoke(
+                    {"input": self._agent_input(lat, lng, preferences)},
+                    config={"callbacks": [self.metrics_callback, self.breaker_callback]}
+                ),
+                timeout=self._upstream_timeout()
+            )
+        except (asyncio.TimeoutError, DeadlineExceeded):
+            logger.warning("Agent run exceeded the request deadline")
+            return self._deadline_result(lat, lng)
+        response = result["output"]
+        logger.info(f"Agent response: {response}")
+        return self._agent_result(lat, lng, response)
+    
+    async def _run_pipeline(self, lat: float, lng: float, preferences: List[str]) -> Dict[str, Any]:
+        """Look up the place directly and decide with a single structured LLM call."""
+        place_info = await self.get_place_details(lat, lng)
+        if "error" in place_info:
+            return self._place_error_result(lat, lng, place_info)
+        
+        try:
+            decision = await self.decide(place_info, preferences)
+        except Exception as e:
+            logger.error(f"Failed to generate decision: {str(e)}")
+            return self._build_result(lat, lng, True, self._fallback_reminder(place_info, self._fallback_reason(e)))
+        
+        return self._build_result(lat, lng, decision["worthy"], decision["message"])
+    
+    async def decide(self, place_info: Dict[str, Any], preferences: List[str]) -> Dict[str, Any]:
+        """Return the {worthy, message} decision for a place, from the prefilter, the cache or a single LLM call."""
+        ruled = self._prefilter_decision(place_info, preferences)
+        if ruled is not None:
+            return ruled
+        
+        cache_key = self.reminder_cache_key("decision", place_info, preferences)
+        cached = await self._reminder_cache_call(self.reminder_cache.get, cache_key)
+        if cached is not None:
+            logger.info(f"Decision cache hit for {place_info.get('name')}: {cached}")
+            return cached
+        
+        response = await self._ainvoke_llm(self._decision_prompt(place_info, preferences), "decision")
+        decision = self._parse_decision(response)
+        logger.info(f"Pipeline decision for {place_info.get('name')}: {decision}")
+        await self._reminder_cache_call(self.reminder_cache.set, cache_key, decision)
+        return decision
@@ -0,0 +1,420 @@
+"""Offline load test for /process-location and PhotoReminderAgent.process_location.
+
+Gemini is replaced by FakeChatModel and Google Places by a local StubPlacesServer,
+so runs need no API keys or network access and are repeatable. Example:
+
+    python benchmark.py --requests 500 --concurrency 20 --mode pipeline --output bench_results.json
+    python benchmark.py --requests 500 --concurrency 20 --compare bench_results.json
+"""
+import os
+import re
+import ast
+import json
+import time
+import random
+import asyncio
+import hashlib
+import argparse
+import logging
+import platform
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qs
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from pydantic import PrivateAttr
+
+logger = logging.getLogger(__name__)
+
+PLACE_TYPES = ["park", "museum", "cafe", "tourist_attraction", "restaurant", "gas_station", "parking", "art_gallery"]
+FILLER_WORDS = ["capture", "the", "moment", "here", "with", "great", "light", "and", "views"]
+
+
+def _stable_hash(text: str) -> int:
+    return int(hashlib.md5(text.encode("utf-8")).hexdigest()[:8], 16)
+
+
+class FakeChatModel(BaseChatModel):
+    """Chat model stand-in with configurable latency and output length.
+
+    It answers the prompts used in agent.py: the structured-chat ReAct loop, the
+    generate_photo_reminder tool prompt and the pipeline JSON decision prompt.
+    """
+
+    latency: float = 0.5
+    per_token_latency: float = 0.0
+    output_tokens: int = 12
+    worthy_ratio: float = 0.8
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+    _calls: int = PrivateAttr(default=0)
+    _tokens: int = PrivateAttr(default=0)
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-benchmark-chat"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    @property
+    def tokens(self) -> int:
+        return self._tokens
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self._calls = 0
+            self._tokens = 0
+
+    def _filler(self, seed: str) -> str:
+        rng = random.Random(_stable_hash(seed))
+        return " ".join(rng.choice(FILLER_WORDS) for _ in range(max(self.output_tokens - 2, 0)))
+
+    def _is_worthy(self, seed: str) -> bool:
+        return (_stable_hash(seed) % 1000) / 1000 < self.worthy_ratio
+
+    def _respond(self, messages: List[BaseMessage]) -> str:
+        prompt = str(messages[-1].content)
+
+        if "Respond with ONLY a JSON object" in prompt:
+            name = re.search(r"Name: (.*)", prompt)
+            seed = name.group(1) if name else prompt
+            if self._is_worthy(seed):
+                return json.dumps({"worthy": True, "message": f"📸 {self._filler(seed)}!"})
+            return json.dumps({"worthy": False, "message": "Not worth a photo here."})
+
+        if "Create a friendly photo reminder" in prompt:
+            return f"📸 {self._filler(prompt)}!"
+
+        # Structured-chat ReAct loop: the step is given by how many observations came back
+        observations = prompt.split("\nObservation: ")
+        if len(observations) == 1:
+            coordinates = re.search(r"coordinates (-?\d+(?:\.\d+)?),(-?\d+(?:\.\d+)?)", prompt)
+            action_input = {"latitude": float(coordinates.group(1)), "longitude": float(coordinates.group(2))}
+            return self._action("get_place_details", action_input)
+        if len(observations) == 2:
+            observation = observations[1].split("\nThought:")[0]
+            try:
+                place_info = ast.literal_eval(observation)
+            except (ValueError, SyntaxError):
+                place_info = {"name": "current location"}
+            preferences = re.search(r"my preferences: (\[.*?\])", prompt)
+            preference_list = ast.literal_eval(preferences.group(1)) if preferences else []
+            if not self._is_worthy(str(place_info.get("name"))):
+                return self._action("Final Answer", "This place is not worth a photo.")
+            return self._action("generate_photo_reminder", {"place_info": place_info, "preferences": preference_list})
+        reminder = observations[-1].split("\nThought:")[0].strip()
+        return self._action("Final Answer", reminder)
+
+    @staticmethod
+    def _action(action: str, action_input: Any) -> str:
+        blob = json.dumps({"action": action, "action_input": action_input}, ensure_ascii=False)
+        return f"Action:\n```\n{blob}\n```"
+
+    def _record(self, text: str) -> float:
+        tokens = len(text.split())
+        with self._lock:
+            self._calls += 1
+            self._tokens += tokens
+        return self.latency + tokens * self.per_token_latency
+
+    @staticmethod
+    def _result(messages: List[BaseMessage], text: str) -> ChatResult:
+        # Report word counts as token usage so the /metrics token counters move during benchmarks
+        input_tokens = sum(len(str(m.content).split()) for m in messages)
+        output_tokens = len(text.split())
+        usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                 "total_tokens": input_tokens + output_tokens}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        time.sleep(self._record(text))
+        return self._result(messages, text)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._respond(messages)
+        await asyncio.sleep(self._record(text))
+        return self._result(messages, text)
+
+
+class StubPlacesServer:
+    """Local HTTP server that answers Places nearbysearch requests with deterministic places."""
+
+    def __init__(self, latency: float = 0.05, host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with server._lock:
+                    server.calls += 1
+                time.sleep(server.latency)
+                query = parse_qs(urlparse(self.path).query)
+                lat, lng = (float(v) for v in query.get("location", ["0,0"])[0].split(","))
+                body = json.dumps(server.place_for(lat, lng)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/maps/api/place/nearbysearch/json"
+
+    @staticmethod
+    def place_for(lat: float, lng: float) -> Dict[str, Any]:
+        # One place per ~100 m grid square
+        key = f"{round(lat, 3)},{round(lng, 3)}"
+        seed = _stable_hash(key)
+        return {
+            "status": "OK",
+            "results": [{
+                "name": f"Place {seed % 100000}",
+                "types": [PLACE_TYPES[seed % len(PLACE_TYPES)], "point_of_interest"],
+                "vicinity": f"{seed % 999} Benchmark Street",
+                "rating": round(3 + (seed % 20) / 10, 1),
+                "user_ratings_total": seed % 1000
+            }]
+        }
+
+    def start(self) -> "StubPlacesServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def build_workload(count: int, hotspots: int, jitter_m: float, seed: int) -> List[Tuple[float, float, str]]:
+    """Generate (lat, lng, preferences) requests clustered around a set of hot spots."""
+    rng = random.Random(seed)
+    centers = [(40.70 + rng.random() * 0.1, -74.02 + rng.random() * 0.1) for _ in range(hotspots)]
+    preference_sets = ["nature, architecture", "food", "art, unique", "nature"]
+    jitter_deg = jitter_m / 111_000
+    workload = []
+    for _ in range(count):
+        lat, lng = rng.choice(centers)
+        workload.append((
+            lat + rng.uniform(-jitter_deg, jitter_deg),
+            lng + rng.uniform(-jitter_deg, jitter_deg),
+            rng.choice(preference_sets)
+        ))
+    return workload
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(rank, len(sorted_values) - 1)]
+
+
+async def drive(call, workload: List[Tuple[float, float, str]], concurrency: int) -> Tuple[List[float], int, float]:
+    """Run every workload item through call with at most concurrency in flight."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    errors = 0
+
+    async def one(item):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            try:
+                ok = await call(*item)
+            except Exception as e:
+                logger.debug(f"Request failed: {e}")
+                ok = False
+            latencies.append(time.perf_counter() - started)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(item) for item in workload))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def run_benchmark(args: argparse.Namespace, places: StubPlacesServer, llm: FakeChatModel) -> Dict[str, Any]:
+    """Drive the chosen target with the generated workload and return the report."""
+    import httpx
+    import main
+    from agent import AsyncPhotoReminderAgent
+
+    agent = AsyncPhotoReminderAgent(verbose=False, mode=args.mode, llm=llm)
+    main.photo_agent = agent
+
+    if args.target == "app":
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark")
+
+        async def call(lat, lng, preferences):
+            response = await client.post("/process-location", data={
+                "latitude": lat, "longitude": lng, "preferences": preferences
+            })
+            if response.status_code != 200:
+                return False
+            # Agent failures come back as a 200 with the error text as the message
+            return not response.json().get("message", "").startswith("Error processing location")
+    else:
+        client = None
+
+        async def call(lat, lng, preferences):
+            result = await agent.process_location(lat, lng, [p.strip() for p in preferences.split(",")])
+            return "error" not in result
+
+    try:
+        if args.warmup:
+            await drive(call, build_workload(args.warmup, args.hotspots, args.jitter_m, args.seed + 1), args.concurrency)
+        llm.reset_counters()
+        places.calls = 0
+
+        workload = build_workload(args.requests, args.hotspots, args.jitter_m, args.seed)
+        latencies, errors, duration = await drive(call, workload, args.concurrency)
+    finally:
+        if client is not None:
+            await client.aclose()
+        await agent.aclose()
+
+    latencies.sort()
+    count = len(latencies)
+    return {
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "git_commit": _git_commit()
+        },
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "requests": count,
+        "errors": errors,
+        "duration_s": round(duration, 3),
+        "throughput_rps": round(count / duration, 2) if duration else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / count * 1000, 2) if count else 0.0,
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if count else 0.0
+        },
+        "llm_calls_per_request": round(llm.calls / count, 3) if count else 0.0,
+        "llm_tokens_per_request": round(llm.tokens / count, 1) if count else 0.0,
+        "places_calls_per_request": round(places.calls / count, 3) if count else 0.0
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+COMPARED_METRICS = [
+    ("throughput_rps", lambda r: r["throughput_rps"]),
+    ("latency p50 ms", lambda r: r["latency_ms"]["p50"]),
+    ("latency p95 ms", lambda r: r["latency_ms"]["p95"]),
+    ("latency p99 ms", lambda r: r["latency_ms"]["p99"]),
+    ("llm calls/req", lambda r: r["llm_calls_per_request"]),
+    ("places calls/req", lambda r: r["places_calls_per_request"]),
+    ("errors", lambda r: r["errors"])
+]
+
+
+def print_report(report: Dict[str, Any], baseline: Optional[Dict[str, Any]] = None) -> None:
+    """Print the key metrics, with the change against a baseline run when given."""
+    print(f"\n{report['requests']} requests in {report['duration_s']}s "
+          f"(target={report['config']['target']}, mode={report['config']['mode']}, "
+          f"concurrency={report['config']['concurrency']})")
+    for label, metric in COMPARED_METRICS:
+        line = f"  {label:<18} {metric(report):>10}"
+        if baseline is not None:
+            before = metric(baseline)
+            change = f"{(metric(report) - before) / before * 100:+.1f}%" if before else "n/a"
+            line += f"   baseline {before:>10}   {change}"
+        print(line)
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Offline latency benchmark for the photo reminder pipeline")
+    parser.add_argument("--target", choices=["app", "agent"], default="app",
+                        help="drive the FastAPI app (/process-location) or the agent directly (default: app)")
+    parser.add_argument("--mode", choices=["agent", "pipeline"], default="agent", help="agent processing mode")
+    parser.add_argument("--requests", type=int, default=200, help="number of measured requests")
+    parser.add_argument("--warmup", type=int, default=0, help="requests to run before measuring")
+    parser.add_argument("--concurrency", type=int, default=10, help="requests in flight at once")
+    parser.add_argument("--hotspots", type=int, default=50, help="number of distinct places requests cluster around")
+    parser.add_argument("--jitter-m", type=float, default=10.0, help="random offset around each hot spot, in meters")
+    parser.add_argument("--seed", type=int, default=42, help="workload random seed")
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="fake LLM seconds per call")
+    parser.add_argument("--llm-token-latency", type=float, default=0.0, help="fake LLM extra seconds per output token")
+    parser.add_argument("--llm-tokens", type=int, default=12, help="fake LLM output length for free-text replies")
+    parser.add_argument("--worthy-ratio", type=float, default=0.8, help="share of places the fake LLM finds photo-worthy")
+    parser.add_argument("--places-latency", type=float, default=0.05, help="stub Places seconds per request")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--log-level", default="WARNING", help="logging level for the app under test")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level.upper())
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    places = StubPlacesServer(latency=args.places_latency).start()
+    # Must be set before agent.py and main.py are imported
+    os.environ["PLACES_API_URL"] = places.url
+    os.environ.setdefault("GOOGLE_API_KEY", "benchmark")
+    os.environ.setdefault("PLACES_API_KEY", "benchmark")
+    os.environ["REMINDER_STORE"] = "memory"
+    os.environ["REMINDER_CACHE_PATH"] = ""
+    os.environ["PHOTO_AGENT_EAGER_INIT"] = "false"
+    # Measure the live pipeline, not precomputed answers
+    os.environ["TILE_INDEX_PATH"] = ""
+
+    llm = FakeChatModel(
+        latency=args.llm_latency,
+        per_token_latency=args.llm_token_latency,
+        output_tokens=args.llm_tokens,
+        worthy_ratio=args.worthy_ratio
+    )
+    try:
+        report = asyncio.run(run_benchmark(args, places, llm))
+    finally:
+        places.stop()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report to {args.output}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+import re
+from itertools import takewhile
+from typing import Any, Dict, List, Set, Tuple
+
+# Snippets whose word shingles overlap at least this much are treated as the same text
+DUPLICATE_THRESHOLD = 0.6
+
+# Words that tell the model what kind of place it is
+PLACE_TYPE_WORDS = {
+    "beach", "park", "museum", "gallery", "landmark", "monument", "memorial", "castle", "palace",
+    "cathedral", "church", "temple", "mosque", "shrine", "tower", "bridge", "garden", "zoo",
+    "aquarium", "lake", "river", "mountain", "waterfall", "island", "harbor", "harbour", "pier",
+    "square", "plaza", "market", "street", "district", "neighborhood", "restaurant", "cafe",
+    "bar", "hotel", "stadium", "arena", "theater", "theatre", "library", "university", "mall",
+    "station", "airport", "viewpoint", "trail", "forest", "canyon", "cave", "fountain", "statue"
+}
+
+# Words that suggest something worth photographing
+ATTRACTION_WORDS = {
+    "attraction", "attractions", "famous", "iconic", "historic", "historical", "scenic", "view",
+    "views", "panoramic", "sunset", "sunrise", "skyline", "architecture", "landmark", "popular",
+    "visitors", "tourists", "tourist", "festival", "exhibit", "exhibition", "collection", "art",
+    "mural", "lights", "colorful", "beautiful", "stunning", "unique", "largest", "oldest",
+    "built", "century", "heritage", "unesco", "wildlife", "nature", "photo", "photos"
+}
+
+# Sentences that are about the web page rather than the place
+BOILERPLATE_WORDS = {
+    "cookies", "cookie", "login", "sign", "subscribe", "newsletter", "click", "javascript",
+    "browser", "copyright", "reserved", "privacy", "advertisement", "sponsored"
+}
+
+_SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+|\s*(?:\.\.\.|…)\s*|\s+[|·•]\s+")
+_WORD = re.compile(r"[a-z0-9']+")
+_SENTENCE_END = re.compile(r"[.!?](?=\s|$)|\n")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the LLM token count of a text (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.casefold())
+
+
+def _shingles(words: List[str], size: int = 3) -> Set[Tuple[str, ...]]:
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _similarity(a: Set[Tuple[str, ...]], b: Set[Tuple[str, ...]]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def truncate_at_sentence(text: str, token_budget: int) -> str:
+    """Cut text to the token budget at the last sentence or line end that fits, else at a word boundary."""
+    limit = token_budget * 4
+    if len(text) <= limit:
+        return text
+    # Match on the whole text so a period right before the limit must still be followed by a space
+    ends = takewhile(lambda end: end <= limit, (m.end() for m in _SENTENCE_END.finditer(text)))
+    cut = max(ends, default=0)
+    if not cut:
+        cut = text.rfind(" ", 0, limit)
+    truncated = text[:cut].rstrip() if cut > 0 else ""
+    # estimate_tokens rounds up, so stay on the safe side of the budget whatever the cut
+    return truncated if estimate_tokens(truncated) <= token_budget else truncated[:limit]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split a search snippet into sentences, dropping the fragments DuckDuckGo elides with '...'."""
+    sentences = [s.strip(" -–—") for s in _SENTENCE_SPLIT.split(text or "")]
+    return [s for s in sentences if len(_words(s)) >= 3]
+
+
+def score_sentence(sentence: str, name_words: Set[str]) -> float:
+    """Score how much a sentence says about the place's type and attractions."""
+    words = _words(sentence)
+    if not words:
+        return 0.0
+    unique = set(words)
+    score = (
+        2.0 * len(unique & PLACE_TYPE_WORDS)
+        + 1.5 * len(unique & ATTRACTION_WORDS)
+        + 1.0 * len(unique & name_words)
+        - 3.0 * len(unique & BOILERPLATE_WORDS)
+    )
+    # Favour dense sentences over long ones that mention the same keywords once
+    return score / (1 + len(words) / 25)
+
+
+def format_search_results(results: List[Dict[str, Any]]) -> str:
+    """Join search results into the uncompacted prompt context."""
+    return "\n".join(f"Title: {result['title']}\nDescription: {result['body']}" for result in results)
+
+
+def compact_search_results(results: List[Dict[str, Any]], place_name: str,
+                           token_budget: int) -> Tuple[str, Dict[str, int]]:
+    """Reduce search results to their most relevant, non-repeated sentences within a token budget.
+
+    Results that already fit the budget only lose their repeated sentences; larger ones are
+    ranked and trimmed to the best sentences. Returns the compacted context, formatted like
+    format_search_results, and the token counts before and after so callers can report the savings.
+    """
+    original = format_search_results(results)
+    original_tokens = estimate_tokens(original)
+    name_words = set(_words(place_name))
+
+    # Collect candidate sentences, skipping titles and sentences that repeat earlier ones
+    seen: List[Set[Tuple[str, ...]]] = []
+    titles: List[str] = []
+    candidates: List[Tuple[float, int, int, str]] = []
+    duplicates = 0
+    for index, result in enumerate(results):
+        title_shingles = _shingles(_words(result.get("title", "")))
+        if any(_similarity(title_shingles, other) >= DUPLICATE_THRESHOLD for other in seen):
+            titles.append("")
+        else:
+            titles.append(result.get("title", ""))
+            seen.append(title_shingles)
+        for position, sentence in enumerate(split_sentences(result.get("body", ""))):
+            shingles = _shingles(_words(sentence))
+            if any(_similarity(shingles, other) >= DUPLICATE_THRESHOLD for other in seen):
+                duplicates += 1
+                continue
+            seen.append(shingles)
+            candidates.append((score_sentence(sentence, name_words), index, position, sentence))
+
+    kept: Dict[int, List[Tuple[int, str]]] = {}
+    if original_tokens <= token_budget:
+        # Already within budget: only the repeats go, however little a sentence scores
+        for _, index, position, sentence in candidates:
+            kept.setdefault(index, []).append((position, sentence))
+    else:
+        # Keep the best sentences that fit, charging each result's title when its first sentence is kept
+        used = 0
+        for score, index, position, sentence in sorted(candidates, key=lambda c: (-c[0], c[1], c[2])):
+            if score <= 0 and kept:
+                break
+            cost = estimate_tokens(sentence) + 1
+            if index not in kept:
+                cost += estimate_tokens(f"Title: {titles[index]}\nDescription: ")
+            if used + cost > token_budget:
+                continue
+            kept.setdefault(index, []).append((position, sentence))
+            used += cost
+
+    # Present the kept sentences in their original order
+    blocks = []
+    for index in sorted(kept):
+        body = " ".join(sentence for _, sentence in sorted(kept[index]))
+        blocks.append(f"Title: {titles[index]}\nDescription: {body}" if titles[index] else f"Description: {body}")
+    compacted = "\n".join(blocks)
+    if not compacted:
+        # Nothing fit or the snippets had no usable sentences: cut the original to the budget instead
+        compacted = truncate_at_sentence(original, token_budget)
+
+    stats = {
+        "original_tokens": original_tokens,
+        "compacted_tokens": estimate_tokens(compacted),
+        "duplicates_removed": duplicates,
+        "sentences_kept": sum(len(sentences) for sentences in kept.values()),
+        "sentences_total": len(candidates) + duplicates
+    }
+    stats["tokens_saved"] = stats["original_tokens"] - stats["compacted_tokens"]
+    return compacted, stats
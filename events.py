@@ -0,0 +1,57 @@
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Set
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class EventBroker:
+    """Fan-out of server-sent events to the open streams of each client in this process.
+
+    Queues hold (event, data) pairs; streams format them with format_sse.
+    """
+
+    def __init__(self, max_queue_size: int = 100):
+        """Initialize the broker with a per-stream queue limit."""
+        self.max_queue_size = max_queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+
+    def subscribe(self, client_id: str) -> asyncio.Queue:
+        """Register a new stream for a client and return its event queue."""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._subscribers.setdefault(client_id, set()).add(queue)
+        logger.info(f"Client {client_id} subscribed to events ({len(self._subscribers[client_id])} streams)")
+        return queue
+
+    def unsubscribe(self, client_id: str, queue: asyncio.Queue) -> None:
+        """Remove a stream when its connection closes."""
+        queues = self._subscribers.get(client_id)
+        if not queues:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[client_id]
+        logger.info(f"Client {client_id} unsubscribed from events")
+
+    def has_subscribers(self, client_id: str) -> bool:
+        """Return True if the client has at least one open stream."""
+        return bool(self._subscribers.get(client_id))
+
+    def publish(self, client_id: str, event: str, data: Dict[str, Any]) -> int:
+        """Queue an event for every open stream of a client and return how many received it."""
+        delivered = 0
+        for queue in list(self._subscribers.get(client_id, ())):
+            try:
+                queue.put_nowait((event, data))
+                delivered += 1
+            except asyncio.QueueFull:
+                # A stalled stream should not hold up the others
+                logger.warning(f"Dropping {event} event for client {client_id}: stream queue is full")
+        return delivered
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """Encode an event in the text/event-stream wire format."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
@@ -0,0 +1,162 @@
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit."""
+
+
+class JobQueue:
+    """Bounded queue of evaluation jobs drained by a fixed pool of asyncio workers.
+
+    Submitting never waits: when max_depth jobs are already waiting, submit raises
+    QueueFullError so the caller can shed load instead of piling up requests.
+    Finished jobs are kept for result_ttl seconds (at most max_results of them).
+    """
+
+    def __init__(self, handler: Callable[..., Awaitable[Any]], workers: int = 8, max_depth: int = 1000,
+                 result_ttl: float = 600.0, max_results: int = 10000):
+        """Initialize the queue; handler is awaited with each job's keyword arguments."""
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.max_results = max_results
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._running = 0
+
+    def start(self) -> None:
+        """Start the worker pool on the running event loop."""
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_depth)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Started {self.workers} job workers (queue depth limit {self.max_depth})")
+
+    async def stop(self) -> None:
+        """Cancel the workers; jobs still queued are dropped."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, **kwargs: Any) -> Dict[str, Any]:
+        """Queue a job and return its public record, or raise QueueFullError."""
+        if self._queue is None:
+            raise RuntimeError("Job queue is not running")
+        self._prune()
+        job = {
+            "id": uuid.uuid4().hex,
+            "status": QUEUED,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "result": None,
+            "error": None
+        }
+        try:
+            self._queue.put_nowait((job, kwargs))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            raise QueueFullError(f"Job queue is full ({self.max_depth} jobs waiting)")
+        self._jobs[job["id"]] = job
+        self.submitted += 1
+        return self._public(job)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's public record, or None if it is unknown or has expired."""
+        self._prune()
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        record = self._public(job)
+        if job["status"] == QUEUED:
+            record["position"] = self._position(job_id)
+        return record
+
+    def depth(self) -> int:
+        """Return how many jobs are waiting for a worker."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return queue depth, worker usage and job counters."""
+        return {
+            "workers": self.workers,
+            "busy_workers": self._running,
+            "depth": self.depth(),
+            "max_depth": self.max_depth,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed
+        }
+
+    async def _worker(self, index: int) -> None:
+        while True:
+            job, kwargs = await self._queue.get()
+            job["status"] = RUNNING
+            job["started_at"] = time.time()
+            self._running += 1
+            try:
+                job["result"] = await self.handler(**kwargs)
+                job["status"] = DONE
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Job {job['id']} failed: {str(e)}")
+                job["error"] = str(e)
+                job["status"] = FAILED
+                self.failed += 1
+            finally:
+                job["finished_at"] = time.time()
+                self._finished[job["id"]] = job["finished_at"]
+                self._running -= 1
+                self._queue.task_done()
+
+    def _position(self, job_id: str) -> int:
+        """Return how many queued jobs are ahead of this one."""
+        position = 0
+        for other_id, other in self._jobs.items():
+            if other_id == job_id:
+                break
+            if other["status"] == QUEUED:
+                position += 1
+        return position
+
+    def _prune(self) -> None:
+        """Forget finished jobs past their TTL, and the oldest finished ones beyond max_results."""
+        now = time.time()
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            if len(self._finished) <= self.max_results and now - finished_at <= self.result_ttl:
+                break
+            del self._finished[job_id]
+            self._jobs.pop(job_id, None)
+
+    @staticmethod
+    def _public(job: Dict[str, Any]) -> Dict[str, Any]:
+        record = dict(job)
+        if record["status"] in (QUEUED, RUNNING):
+            del record["result"]
+            del record["error"]
+        return record
@@ -1,144 +1,569 @@
-from fastapi import FastAPI, Request, Form, HTTPException
+import time
+_import_started = time.perf_counter()
+
+from fastapi import FastAPI, Request, Form, HTTPException, Cookie
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, JSONResponse
-from typing import List, Optional
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse, PlainTextResponse
+from fastapi.concurrency import run_in_threadpool
+from typing import List, Optional, Dict, Any
 import os
 import json
+import math
+import asyncio
+import uuid
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
-from agent import PhotoReminderAgent
+from agent import MODES
+from cache import geohash_encode
+from store import create_reminder_store, DEFAULT_CLIENT_ID
+from events import EventBroker, format_sse
+from jobs import JobQueue, QueueFullError
+from sampling import SamplingPolicy
+from quota import BATCH, get_scheduler, request_priority
+from resilience import Deadline
+from timing import StartupTimer
+from metrics import REGISTRY, HTTP_REQUEST_DURATION, SAMPLING_DECISIONS, stage_timer, start_trace, finish_trace, cache_collector, breaker_collector, queue_collector, quota_collector
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+startup_timer = StartupTimer(started_at=_import_started)
+startup_timer.record("imports", _import_started)
+
+# The agent pulls in LangChain and Gemini, so it is built once, on first use or in the lifespan hook
+photo_agent = None
+initialization_error = None
+PHOTO_AGENT_EAGER_INIT = os.getenv("PHOTO_AGENT_EAGER_INIT", "true").lower() in ("1", "true", "yes")
+
+def get_photo_agent():
+    """Return the shared AsyncPhotoReminderAgent, building it on the first call."""
+    global photo_agent, initialization_error
+    if photo_agent is not None:
+        return photo_agent
+    if initialization_error is not None:
+        # Configuration errors do not fix themselves, so don't rebuild on every request
+        raise HTTPException(status_code=500, detail=f"Photo agent not initialized: {initialization_error}")
+    
+    missing_keys = [key for key in ("GOOGLE_API_KEY", "PLACES_API_KEY") if not os.getenv(key)]
+    if missing_keys:
+        initialization_error = f"Missing required API keys: {', '.join(missing_keys)}"
+        logger.error(initialization_error)
+        logger.error("Please set these environment variables or add them to a .env file")
+        raise HTTPException(status_code=500, detail=f"Photo agent not initialized: {initialization_error}")
+    
+    try:
+        with startup_timer.phase("agent_init"):
+            from agent import AsyncPhotoReminderAgent
+            photo_agent = AsyncPhotoReminderAgent(verbose=False)
+        logger.info("PhotoReminderAgent initialized successfully")
+        return photo_agent
+    except Exception as e:
+        logger.error(f"Failed to initialize PhotoReminderAgent: {e}")
+        initialization_error = str(e)
+        raise HTTPException(status_code=500, detail=f"Photo agent not initialized: {initialization_error}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build the agent before serving when eager init is on, and release it on shutdown."""
+    if PHOTO_AGENT_EAGER_INIT:
+        try:
+            get_photo_agent()
+        except HTTPException:
+            pass  # Already logged; requests will report the error
+    job_queue.start()
+    startup_timer.mark_ready()
+    startup_timer.log_report(os.getenv("STARTUP_REPORT_PATH") or None)
+    yield
+    await job_queue.stop()
+    if photo_agent is not None:
+        # Release the agent's pooled HTTP connections
+        await photo_agent.aclose()
+
 # Create FastAPI app
-app = FastAPI(title="Photo Reminder App")
+with startup_timer.phase("app_setup"):
+    app = FastAPI(title="Photo Reminder App", lifespan=lifespan)
+    
+    # Set up templates
+    templates = Jinja2Templates(directory="templates")
+    
+    # Mount static files
+    app.mount("/static", StaticFiles(directory="static"), name="static")
 
-# Set up templates
-templates = Jinja2Templates(directory="templates")
+# Expose the agent's cache counters and circuit breakers on /metrics once the agent exists
+REGISTRY.register_collector(cache_collector(lambda: photo_agent.cache_stats() if photo_agent else {}))
+REGISTRY.register_collector(breaker_collector(lambda: photo_agent.breaker_stats() if photo_agent else {}))
+REGISTRY.register_collector(queue_collector(lambda: job_queue.stats()))
+REGISTRY.register_collector(quota_collector(lambda: get_scheduler().stats()))
 
-# Mount static files
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time every request and, with TRACE_REQUESTS enabled, log its per-stage breakdown."""
+    started = time.perf_counter()
+    trace_token = start_trace()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - started
+        # Label by route template so /dismiss-reminder/{reminder_id} stays a single series
+        route = request.scope.get("route")
+        path = getattr(route, "path", None) or "unmatched"
+        HTTP_REQUEST_DURATION.observe(elapsed, path=path, status=str(status))
+        finish_trace(trace_token, f"{request.method} {request.url.path} {status}", elapsed)
+
+# Limits for the /process-locations batch endpoint
+BATCH_MAX_POINTS = int(os.getenv("BATCH_MAX_POINTS", "10000"))
+BATCH_DEFAULT_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "32"))
+BATCH_MAX_BODY_BYTES = int(os.getenv("BATCH_MAX_BODY_BYTES", str(4 * 1024 * 1024)))
+# Batch cells queue behind interactive requests for quota, so they get a longer time budget
+BATCH_DEADLINE_SECONDS = float(os.getenv("BATCH_DEADLINE_SECONDS", "60"))
+
+# Storage for active reminders, shared between workers when backed by SQLite.
+# Its calls can wait on the database lock, so endpoints run them in the threadpool.
+with startup_timer.phase("reminder_store"):
+    reminder_store = create_reminder_store()
+REMINDERS_PER_PAGE = int(os.getenv("REMINDERS_PER_PAGE", "20"))
+
+# Server-sent event streams and background location evaluations per client
+event_broker = EventBroker()
+SSE_KEEPALIVE_SECONDS = float(os.getenv("SSE_KEEPALIVE_SECONDS", "15"))
+# How often each stream checks the store for reminders made on other workers; 0 turns it off
+SSE_POLL_SECONDS = float(os.getenv("SSE_POLL_SECONDS", "2"))
+background_evaluations: Dict[str, asyncio.Task] = {}
+pending_locations: Dict[str, tuple] = {}
 
-# Initialize the PhotoReminderAgent
-try:
-    photo_agent = PhotoReminderAgent(verbose=False)
-    logger.info("PhotoReminderAgent initialized successfully")
-except EnvironmentError as e:
-    logger.error(f"Failed to initialize PhotoReminderAgent: {e}")
-    photo_agent = None
-except Exception as e:
-    logger.error(f"Unexpected error initializing PhotoReminderAgent: {e}")
-    photo_agent = None
+# Retry-After hint sent when the background job queue is full
+JOB_RETRY_AFTER_SECONDS = int(os.getenv("JOB_RETRY_AFTER_SECONDS", "5"))
 
-# In-memory storage for active reminders (will be lost on restart)
-active_reminders = []
+# Per-client dwell and movement tracking that tells clients when to check again
+sampling_policy = SamplingPolicy.from_env()
+
+def resolve_client_id(form_value: Optional[str], cookie_value: Optional[str]) -> str:
+    """Pick the client id from the form field, then the cookie, then the shared default."""
+    return (form_value or cookie_value or DEFAULT_CLIENT_ID).strip()[:64]
 
 @app.get("/", response_class=HTMLResponse)
-async def get_home(request: Request):
-    """Render the home page."""
-    return templates.TemplateResponse(
+async def get_home(request: Request, page: int = 1, client_id: Optional[str] = Cookie(None)):
+    """Render the home page with one page of the client's reminders."""
+    new_client = client_id is None
+    client_id = resolve_client_id(None, client_id or uuid.uuid4().hex)
+    
+    page = max(page, 1)
+    total = await run_in_threadpool(reminder_store.count, client_id)
+    reminders = await run_in_threadpool(
+        reminder_store.list, client_id, offset=(page - 1) * REMINDERS_PER_PAGE, limit=REMINDERS_PER_PAGE
+    )
+    
+    response = templates.TemplateResponse(
         "index.html", 
-        {"request": request, "reminders": active_reminders}
+        {
+            "request": request,
+            "reminders": reminders,
+            "page": page,
+            "has_prev": page > 1,
+            "has_next": page * REMINDERS_PER_PAGE < total
+        }
     )
+    if new_client:
+        response.set_cookie("client_id", client_id, max_age=365 * 24 * 3600, samesite="lax")
+    return response
+
+def sample_position(client_id: str, latitude: float, longitude: float, preference_list: List[str],
+                    mode: Optional[str], force: bool = False) -> Dict[str, Any]:
+    """Ask the sampling policy whether a position needs evaluating; everything is evaluated when it is off."""
+    if sampling_policy is None:
+        return {"skip": False}
+    # Clients without their own id share the default one, so their positions are not tracked
+    tracked_id = None if client_id == DEFAULT_CLIENT_ID else client_id
+    sample = sampling_policy.observe(tracked_id, latitude, longitude, preference_list, mode=mode, force=force)
+    SAMPLING_DECISIONS.inc(decision="skip" if sample["skip"] else "evaluate")
+    return sample
+
+def sampling_hint(sample: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the fields that tell the client when to check again."""
+    if "next_check_after" not in sample:
+        return {}
+    return {"next_check_after": sample["next_check_after"], "motion": sample["motion"]}
+
+def forget_evaluation(client_id: str) -> None:
+    """Make the client's next position count as new, e.g. after its evaluation failed."""
+    if sampling_policy is not None:
+        sampling_policy.forget_evaluation(client_id)
 
-missing_keys = []
-if not os.getenv("GOOGLE_API_KEY"):
-    missing_keys.append("GOOGLE_API_KEY")
-if not os.getenv("PLACES_API_KEY"):
-    missing_keys.append("PLACES_API_KEY")
-
-if missing_keys:
-    logger.error(f"Missing required API keys: {', '.join(missing_keys)}")
-    logger.error("Please set these environment variables or add them to a .env file")
-    photo_agent = None
-    initialization_error = f"Missing required API keys: {', '.join(missing_keys)}"
-else:
+def render_notification(reminder: Dict[str, Any], fallback_label: str = "New reminder") -> str:
+    """Render the notification component for a reminder, with plain HTML as a fallback."""
     try:
-        photo_agent = PhotoReminderAgent(verbose=False)
-        logger.info("PhotoReminderAgent initialized successfully")
-        initialization_error = None
-    except Exception as e:
-        logger.error(f"Failed to initialize PhotoReminderAgent: {e}")
-        photo_agent = None
-        initialization_error = str(e)
+        with stage_timer("template_render"):
+            return templates.get_template("components/notification.html").render(
+                reminder=reminder,
+                request=None  # You might need to add this if your template requires it
+            )
+    except Exception as template_error:
+        logger.error(f"Template rendering error: {template_error}")
+        return f"<div>{fallback_label}: {reminder['message']}</div>"  # Fallback HTML
+
+async def evaluate_location(client_id: str, latitude: float, longitude: float, preference_list: List[str],
+                            mode: Optional[str], publish: bool = False) -> Dict[str, Any]:
+    """Run the agent for one position, store any reminder and return the /process-location response body."""
+    logger.info(f"Processing location: {latitude}, {longitude} with preferences: {preference_list}")
+    
+    # Process location with the agent
+    result = await get_photo_agent().process_location(latitude, longitude, preference_list, mode=mode)
+    if "error" in result:
+        forget_evaluation(client_id)
+    
+    if result.get("reminder", False):
+        # Add to active reminders if it's a valid reminder
+        reminder = await run_in_threadpool(
+            reminder_store.add, client_id, result["message"], latitude, longitude, preference_list
+        )
+        html_content = render_notification(reminder)
+        if publish:
+            event_broker.publish(client_id, "reminder", {"reminder": reminder, "html": html_content})
+        
+        return {
+            "success": True,
+            "reminder": reminder,
+            "html": html_content
+        }
+    else:
+        # Return the error or message explaining why no reminder was generated
+        return {
+            "success": False,
+            "message": result.get("message", result.get("error", "Unknown error"))
+        }
+
+# Background evaluations queued by /process-location with background=true
+job_queue = JobQueue(
+    evaluate_location,
+    workers=int(os.getenv("JOB_WORKERS", "8")),
+    max_depth=int(os.getenv("JOB_QUEUE_DEPTH", "1000")),
+    result_ttl=float(os.getenv("JOB_RESULT_TTL", "600"))
+)
+
 @app.post("/process-location")
 async def process_location(
     latitude: float = Form(...),
     longitude: float = Form(...),
-    preferences: str = Form(...)
+    preferences: str = Form(...),
+    mode: Optional[str] = Form(None),
+    background: bool = Form(False),
+    force: bool = Form(False),
+    client_id: Optional[str] = Form(None),
+    client_cookie: Optional[str] = Cookie(None, alias="client_id")
 ):
-    """Process a location and generate a photo reminder if appropriate."""
-    if not photo_agent:
-        logger.error("Photo agent not initialized. Check API keys.")
-        raise HTTPException(status_code=500, detail="Photo agent not initialized. Check API keys.")
+    """Process a location and generate a photo reminder if appropriate.
+    
+    With background=true the evaluation is queued instead: the response is 202 with a
+    job id, the result is served at /jobs/{job_id} and any reminder is also pushed on /events.
+    Responses carry next_check_after, the seconds the client should wait before checking
+    again; a repeat check from the same place is skipped unless force=true.
+    """
+    get_photo_agent()
+    if mode and mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    
+    # Parse preferences from comma-separated string
+    preference_list = [p.strip() for p in preferences.split(",") if p.strip()]
+    client_id = resolve_client_id(client_id, client_cookie)
+    
+    sample = sample_position(client_id, latitude, longitude, preference_list, mode, force=force)
+    if sample["skip"]:
+        return {"success": False, "skipped": True, "message": "Same place as the last check", **sampling_hint(sample)}
+    
+    if background:
+        try:
+            job = job_queue.submit(
+                client_id=client_id,
+                latitude=latitude,
+                longitude=longitude,
+                preference_list=preference_list,
+                mode=mode,
+                publish=True
+            )
+        except QueueFullError as e:
+            logger.warning(f"Rejecting background evaluation: {str(e)}")
+            forget_evaluation(client_id)
+            return JSONResponse(
+                status_code=503,
+                content={"success": False, "message": str(e)},
+                headers={"Retry-After": str(JOB_RETRY_AFTER_SECONDS)}
+            )
+        return JSONResponse(
+            status_code=202,
+            content={"success": True, "job": job, "status_url": f"/jobs/{job['id']}", **sampling_hint(sample)}
+        )
     
     try:
-        # Parse preferences from comma-separated string
-        preference_list = [p.strip() for p in preferences.split(",") if p.strip()]
-        
-        logger.info(f"Processing location: {latitude}, {longitude} with preferences: {preference_list}")
-        
-        # Process location with the agent
-        result = photo_agent.process_location(latitude, longitude, preference_list)
-        
-        if result.get("reminder", False):
-            # Add to active reminders if it's a valid reminder
-            reminder_id = len(active_reminders)
-            reminder = {
-                "id": reminder_id,
-                "message": result["message"],
-                "latitude": latitude,
-                "longitude": longitude,
-                "preferences": preference_list
-            }
-            active_reminders.append(reminder)
-            
-            try:
-                # Try to render the notification template
-                html_content = templates.get_template("components/notification.html").render(
-                    reminder=reminder,
-                    request=None  # You might need to add this if your template requires it
-                )
-                
-                return {
-                    "success": True,
-                    "reminder": reminder,
-                    "html": html_content
-                }
-            except Exception as template_error:
-                logger.error(f"Template rendering error: {template_error}")
-                return {
-                    "success": True,
-                    "reminder": reminder,
-                    "html": f"<div>New reminder: {reminder['message']}</div>"  # Fallback HTML
-                }
-        else:
-            # Return the error or message explaining why no reminder was generated
-            return {
-                "success": False,
-                "message": result.get("message", result.get("error", "Unknown error"))
-            }
+        response = await evaluate_location(client_id, latitude, longitude, preference_list, mode)
+        return {**response, **sampling_hint(sample)}
     except Exception as e:
         logger.error(f"Error processing location: {e}")
+        forget_evaluation(client_id)
         return JSONResponse(
             status_code=500,
             content={"success": False, "message": f"Server error: {str(e)}"}
         )
 
-@app.post("/dismiss-reminder/{reminder_id}")
-async def dismiss_reminder(reminder_id: int):
-    """Dismiss a reminder by ID."""
-    global active_reminders
+async def evaluate_in_background(client_id: str, latitude: float, longitude: float,
+                                 preference_list: List[str], mode: Optional[str]):
+    """Evaluate a pushed position and send any new reminder to the client's event streams."""
+    try:
+        while True:
+            await evaluate_location(client_id, latitude, longitude, preference_list, mode, publish=True)
+            
+            # Positions pushed while this evaluation ran collapse into one follow-up run
+            if client_id not in pending_locations:
+                break
+            latitude, longitude, preference_list, mode = pending_locations.pop(client_id)
+    except Exception as e:
+        logger.error(f"Background evaluation failed for client {client_id}: {e}")
+        forget_evaluation(client_id)
+    finally:
+        background_evaluations.pop(client_id, None)
+
+@app.post("/location-update", status_code=202)
+async def location_update(
+    latitude: float = Form(...),
+    longitude: float = Form(...),
+    preferences: str = Form(""),
+    mode: Optional[str] = Form(None),
+    client_id: Optional[str] = Form(None),
+    client_cookie: Optional[str] = Cookie(None, alias="client_id")
+):
+    """Accept a position update and evaluate it in the background; results arrive on /events.
+    
+    Updates from the same place as the last evaluation are skipped; next_check_after says
+    when the client should push again.
+    """
+    get_photo_agent()
+    if mode and mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    
+    client_id = resolve_client_id(client_id, client_cookie)
+    preference_list = [p.strip() for p in preferences.split(",") if p.strip()]
+    
+    sample = sample_position(client_id, latitude, longitude, preference_list, mode)
+    if sample["skip"]:
+        return {"accepted": False, "skipped": True, **sampling_hint(sample)}
+    
+    if client_id in background_evaluations:
+        # Keep only the latest position while an evaluation is already running
+        pending_locations[client_id] = (latitude, longitude, preference_list, mode)
+        return {"accepted": True, "queued": True, **sampling_hint(sample)}
+    
+    background_evaluations[client_id] = asyncio.create_task(
+        evaluate_in_background(client_id, latitude, longitude, preference_list, mode)
+    )
+    return {"accepted": True, "queued": False, **sampling_hint(sample)}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Return the status of a background evaluation and, once finished, its result."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return job
+
+@app.get("/jobs")
+async def job_stats():
+    """Return the background job queue's depth, worker usage and counters."""
+    return job_queue.stats()
+
+@app.get("/events")
+async def events(request: Request, client_id: Optional[str] = Cookie(None)):
+    """Stream new reminders for this client as server-sent events."""
+    client_id = resolve_client_id(request.query_params.get("client_id"), client_id)
+    queue = event_broker.subscribe(client_id)
+    
+    async def event_stream():
+        # Reminders stored by other workers never reach this worker's broker, so the store is
+        # also polled for ids above seen_id; ids already sent are skipped whichever way they came
+        seen_id = await run_in_threadpool(reminder_store.latest_id, client_id)
+        sent_ids = set()
+        next_poll = time.monotonic() + SSE_POLL_SECONDS
+        last_sent = time.monotonic()
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                if SSE_POLL_SECONDS > 0 and time.monotonic() >= next_poll:
+                    stored = await run_in_threadpool(reminder_store.list_after, client_id, seen_id)
+                    for reminder in stored:
+                        seen_id = max(seen_id, reminder["id"])
+                        if reminder["id"] not in sent_ids:
+                            yield format_sse("reminder", {"reminder": reminder, "html": render_notification(reminder)})
+                            last_sent = time.monotonic()
+                    sent_ids = {reminder_id for reminder_id in sent_ids if reminder_id > seen_id}
+                    next_poll = time.monotonic() + SSE_POLL_SECONDS
+                
+                wait = SSE_KEEPALIVE_SECONDS - (time.monotonic() - last_sent)
+                if SSE_POLL_SECONDS > 0:
+                    wait = min(wait, next_poll - time.monotonic())
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=max(wait, 0))
+                except asyncio.TimeoutError:
+                    if time.monotonic() - last_sent >= SSE_KEEPALIVE_SECONDS:
+                        # Comment lines keep proxies from closing an idle stream
+                        yield ": keepalive\n\n"
+                        last_sent = time.monotonic()
+                    continue
+                
+                reminder_id = data.get("reminder", {}).get("id")
+                if reminder_id is not None:
+                    if reminder_id <= seen_id or reminder_id in sent_ids:
+                        continue
+                    sent_ids.add(reminder_id)
+                yield format_sse(event, data)
+                last_sent = time.monotonic()
+        finally:
+            event_broker.unsubscribe(client_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def read_batch_body(request: Request) -> bytes:
+    """Read the request body, rejecting it with 413 as soon as it exceeds BATCH_MAX_BODY_BYTES."""
+    too_large = HTTPException(status_code=413, detail=f"Body too large, the limit is {BATCH_MAX_BODY_BYTES} bytes")
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > BATCH_MAX_BODY_BYTES:
+        raise too_large
+    # Chunked bodies carry no length, so count while reading
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > BATCH_MAX_BODY_BYTES:
+            raise too_large
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def parse_batch_points(body: bytes, content_type: str) -> Dict[str, Any]:
+    """Parse a batch request body given as a JSON object/array or as NDJSON points."""
+    text = body.decode("utf-8")
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        payload = {"points": [json.loads(line) for line in text.splitlines() if line.strip()]}
+    else:
+        payload = json.loads(text)
+        if isinstance(payload, list):
+            payload = {"points": payload}
+        if not isinstance(payload, dict):
+            raise ValueError("Expected a JSON object or an array of points")
+    
+    if not isinstance(payload.get("points", []), list):
+        raise ValueError("'points' must be a list")
+    concurrency = payload.get("concurrency")
+    if concurrency is not None and (isinstance(concurrency, bool) or not isinstance(concurrency, int)):
+        raise ValueError("'concurrency' must be an integer")
+    preferences = payload.get("preferences", "")
+    if not isinstance(preferences, str) and not (
+            isinstance(preferences, list) and all(isinstance(p, str) for p in preferences)):
+        raise ValueError("'preferences' must be a string or a list of strings")
+    if not isinstance(payload.get("mode") or "", str):
+        raise ValueError("'mode' must be a string")
+    
+    points = []
+    for index, point in enumerate(payload.get("points", [])):
+        try:
+            latitude, longitude = float(point["latitude"]), float(point["longitude"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Point {index} must have numeric 'latitude' and 'longitude'")
+        # float() also accepts "nan" and "inf", which would end up as invalid JSON in the stream
+        if not (math.isfinite(latitude) and math.isfinite(longitude)
+                and -90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ValueError(f"Point {index} must have a latitude within ±90 and a longitude within ±180")
+        points.append((latitude, longitude))
+    payload["points"] = points
+    return payload
+
+def cluster_points(points: List[tuple], precision: int) -> Dict[str, List[int]]:
+    """Group point indices by the geohash cell they fall in, keeping first-seen order."""
+    clusters: Dict[str, List[int]] = {}
+    for index, (lat, lng) in enumerate(points):
+        clusters.setdefault(geohash_encode(lat, lng, precision), []).append(index)
+    return clusters
+
+@app.post("/process-locations")
+async def process_locations(
+    request: Request,
+    preferences: Optional[str] = None,
+    concurrency: Optional[int] = None,
+    mode: Optional[str] = None
+):
+    """Evaluate a GPS trace once per distinct place cell and stream NDJSON results as they finish.
+    
+    The body is either a JSON object {"points": [...], "preferences": ..., "concurrency": ...},
+    a JSON array of points, or NDJSON with one {"latitude", "longitude"} object per line.
+    """
+    agent = get_photo_agent()
+    
+    try:
+        payload = parse_batch_points(await read_batch_body(request), request.headers.get("content-type", ""))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid batch body: {str(e)}")
+    
+    points = payload["points"]
+    if len(points) > BATCH_MAX_POINTS:
+        raise HTTPException(status_code=413, detail=f"Too many points, the limit is {BATCH_MAX_POINTS}")
+    
+    mode = mode or payload.get("mode")
+    if mode and mode not in MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {', '.join(MODES)}")
+    
+    preferences = preferences if preferences is not None else payload.get("preferences", "")
+    if isinstance(preferences, str):
+        preferences = preferences.split(",")
+    preference_list = [p.strip() for p in preferences if p.strip()]
+    
+    concurrency = concurrency or payload.get("concurrency") or BATCH_DEFAULT_CONCURRENCY
+    concurrency = max(1, min(concurrency, BATCH_MAX_CONCURRENCY))
+    
+    clusters = cluster_points(points, agent.geohash_precision)
+    logger.info(f"Batch of {len(points)} points reduced to {len(clusters)} place cells (concurrency {concurrency})")
+    
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def evaluate_cluster(cell: str, indices: List[int]) -> Dict[str, Any]:
+        # The first point of each cell stands in for the whole cluster
+        lat, lng = points[indices[0]]
+        async with semaphore:
+            with request_priority(BATCH):
+                result = await agent.process_location(
+                    lat, lng, preference_list, mode=mode, deadline=Deadline(BATCH_DEADLINE_SECONDS)
+                )
+        return {"cell": cell, "points": indices, "latitude": lat, "longitude": lng, "result": result}
+    
+    async def stream_results():
+        tasks = [asyncio.create_task(evaluate_cluster(cell, indices)) for cell, indices in clusters.items()]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield json.dumps(await next_done, ensure_ascii=False) + "\n"
+            yield json.dumps({"done": True, "points": len(points), "clusters": len(clusters)}) + "\n"
+        finally:
+            # Stop outstanding work if the client disconnects mid-stream
+            for task in tasks:
+                task.cancel()
     
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+@app.post("/dismiss-reminder/{reminder_id}")
+async def dismiss_reminder(
+    reminder_id: int,
+    client_id: Optional[str] = Form(None),
+    client_cookie: Optional[str] = Cookie(None, alias="client_id")
+):
+    """Dismiss one of the client's reminders by ID."""
+    client_id = resolve_client_id(client_id, client_cookie)
     try:
-        # Find the reminder by ID
-        reminder = next((r for r in active_reminders if r["id"] == reminder_id), None)
-        if reminder:
-            # Remove the reminder
-            active_reminders = [r for r in active_reminders if r["id"] != reminder_id]
+        if await run_in_threadpool(reminder_store.delete, client_id, reminder_id):
             return {"success": True}
         else:
             return {"success": False, "message": "Reminder not found"}
@@ -146,27 +571,51 @@ async def dismiss_reminder(reminder_id: int):
         logger.error(f"Error dismissing reminder: {e}")
         return {"success": False, "message": str(e)}
 
+@app.get("/cache-stats")
+async def cache_stats():
+    """Return hit/miss statistics for the agent's place and reminder caches."""
+    return get_photo_agent().cache_stats()
+
+@app.get("/prefilter-stats")
+async def prefilter_stats():
+    """Return the place type prefilter verdict counts and how many LLM calls it avoided."""
+    return get_photo_agent().prefilter_stats()
+
+@app.get("/sampling-stats")
+async def sampling_stats():
+    """Return how many client position checks were evaluated or skipped as the same place."""
+    return sampling_policy.stats() if sampling_policy is not None else {}
+
+@app.get("/quota-stats")
+async def quota_stats():
+    """Return upstream quota limits, queue depth and queue wait times per priority class."""
+    return get_scheduler().stats()
+
+@app.get("/metrics")
+async def metrics():
+    """Expose latency histograms and counters in the Prometheus text format."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/startup-report")
+async def startup_report():
+    """Return how long each startup phase took."""
+    return startup_timer.report()
+
 @app.get("/test-reminder")
-async def test_reminder():
+async def test_reminder(client_id: Optional[str] = Cookie(None)):
     """Generate a test reminder (for development purposes)."""
     try:
-        test_reminder = {
-            "id": len(active_reminders),
-            "message": "📸 Test reminder! This is how notifications will look.",
-            "latitude": 40.7812,
-            "longitude": -73.9665,
-            "preferences": ["testing"]
-        }
-        active_reminders.append(test_reminder)
+        test_reminder = await run_in_threadpool(
+            reminder_store.add,
+            resolve_client_id(None, client_id),
+            "📸 Test reminder! This is how notifications will look.",
+            40.7812,
+            -73.9665,
+            ["testing"]
+        )
         
-        try:
-            html_content = templates.get_template("components/notification.html").render(
-                reminder=test_reminder,
-                request=None  # You might need to add this if your template requires it
-            )
-        except Exception as template_error:
-            logger.error(f"Template rendering error: {template_error}")
-            html_content = f"<div>Test reminder: {test_reminder['message']}</div>"  # Fallback HTML
+        html_content = render_notification(test_reminder, fallback_label="Test reminder")
+        event_broker.publish(test_reminder["client_id"], "reminder", {"reminder": test_reminder, "html": html_content})
         
         return {
             "success": True,
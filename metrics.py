@@ -0,0 +1,359 @@
+import os
+import time
+import threading
+import logging
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from cache hits up to slow multi-step agent runs
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(labelnames: Tuple[str, ...], labelvalues: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels: str) -> None:
+        """Increase the counter for the given label values."""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        """Return the current value for the given label values."""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        return self._values.get(key, 0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record one observation for the given label values."""
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            # Per-bucket counts, then the +Inf count and the sum
+            series = self._series.setdefault(key, [0.0] * (len(self.buckets) + 2))
+            index = bisect_left(self.buckets, value)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le_label = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+                cumulative += series[len(self.buckets)]
+                inf_label = 'le="+Inf"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, inf_label)} {cumulative}")
+                lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds the process's metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], List[str]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Iterable[str] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[str]]) -> None:
+        """Add a callable that returns extra exposition lines at scrape time."""
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                lines.extend(collector())
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_DURATION = REGISTRY.histogram(
+    "photo_stage_duration_seconds",
+    "Time spent in each stage of the reminder pipeline.",
+    ["stage"]
+)
+HTTP_REQUEST_DURATION = REGISTRY.histogram(
+    "photo_http_request_duration_seconds",
+    "End-to-end HTTP request latency.",
+    ["path", "status"]
+)
+LLM_CALLS = REGISTRY.counter("photo_llm_calls_total", "LLM calls by purpose.", ["kind"])
+LLM_TOKENS = REGISTRY.counter("photo_llm_tokens_total", "LLM tokens reported by the model.", ["direction"])
+PLACES_REQUESTS = REGISTRY.counter("photo_places_requests_total", "Google Places API requests.", ["result"])
+AGENT_PARSE_ERRORS = REGISTRY.counter(
+    "photo_agent_parse_errors_total",
+    "Agent replies that could not be parsed and were retried via handle_parsing_errors."
+)
+FALLBACK_REMINDERS = REGISTRY.counter(
+    "photo_fallback_reminders_total",
+    "Reminders produced by a fallback instead of the LLM.",
+    ["reason"]
+)
+COALESCED_REQUESTS = REGISTRY.counter(
+    "photo_coalesced_requests_total",
+    "Evaluations that joined an identical in-flight evaluation instead of starting their own."
+)
+TILE_INDEX_LOOKUPS = REGISTRY.counter(
+    "photo_tile_index_lookups_total",
+    "Lookups in the prewarmed tile index.",
+    ["result"]
+)
+SAMPLING_DECISIONS = REGISTRY.counter(
+    "photo_sampling_decisions_total",
+    "Client position checks by whether they were evaluated or skipped as the same place.",
+    ["decision"]
+)
+PREFILTER_DECISIONS = REGISTRY.counter(
+    "photo_prefilter_decisions_total",
+    "Place type prefilter verdicts; accept and reject each saved an LLM call.",
+    ["verdict"]
+)
+
+QUOTA_WAIT = REGISTRY.histogram(
+    "photo_quota_wait_seconds",
+    "Time calls spent queued for upstream quota.",
+    ["upstream", "priority"]
+)
+QUOTA_TIMEOUTS = REGISTRY.counter(
+    "photo_quota_timeouts_total",
+    "Calls that gave up waiting for upstream quota at their deadline.",
+    ["upstream", "priority"]
+)
+
+_current_trace: ContextVar[Optional[List[Tuple[str, float]]]] = ContextVar("photo_request_trace", default=None)
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration in the histogram and in the current request trace, if any."""
+    STAGE_DURATION.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time the enclosed block as a pipeline stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def start_trace() -> Optional[Any]:
+    """Begin collecting stage timings for the current request when TRACE_REQUESTS is enabled."""
+    # Read per request, since metrics is imported before main.py loads .env
+    if os.getenv("TRACE_REQUESTS", "false").lower() not in ("1", "true", "yes"):
+        return None
+    return _current_trace.set([])
+
+
+def finish_trace(token: Optional[Any], label: str, total_seconds: float) -> None:
+    """Log the stages collected since start_trace and stop collecting."""
+    if token is None:
+        return
+    trace = _current_trace.get() or []
+    _current_trace.reset(token)
+    stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in trace)
+    logger.info(f"trace {label} total={total_seconds * 1000:.1f}ms {stages}")
+
+
+def cache_collector(get_stats: Callable[[], Dict[str, Dict[str, Any]]]) -> Callable[[], List[str]]:
+    """Build a collector that exposes TTLCache.stats() dictionaries as metrics."""
+    def collect() -> List[str]:
+        stats = get_stats()
+        if not stats:
+            return []
+        lines = [
+            "# HELP photo_cache_hits_total Cache lookups that found a fresh entry.",
+            "# TYPE photo_cache_hits_total counter"
+        ]
+        lines += [f'photo_cache_hits_total{{cache="{name}"}} {s["hits"]}' for name, s in stats.items()]
+        lines += [
+            "# HELP photo_cache_misses_total Cache lookups that found nothing or an expired entry.",
+            "# TYPE photo_cache_misses_total counter"
+        ]
+        lines += [f'photo_cache_misses_total{{cache="{name}"}} {s["misses"]}' for name, s in stats.items()]
+        lines += ["# HELP photo_cache_entries Entries currently cached.", "# TYPE photo_cache_entries gauge"]
+        lines += [f'photo_cache_entries{{cache="{name}"}} {s["size"]}' for name, s in stats.items()]
+        return lines
+    return collect
+
+
+def breaker_collector(get_stats: Callable[[], Dict[str, Dict[str, Any]]]) -> Callable[[], List[str]]:
+    """Build a collector that exposes CircuitBreaker.stats() dictionaries as metrics."""
+    def collect() -> List[str]:
+        stats = get_stats()
+        if not stats:
+            return []
+        lines = [
+            "# HELP photo_circuit_open Whether the upstream circuit breaker is rejecting calls (1) or not (0).",
+            "# TYPE photo_circuit_open gauge"
+        ]
+        lines += [
+            f'photo_circuit_open{{upstream="{name}"}} {0 if s["state"] == "closed" else 1}'
+            for name, s in stats.items()
+        ]
+        lines += [
+            "# HELP photo_circuit_rejected_total Calls rejected by an open circuit breaker.",
+            "# TYPE photo_circuit_rejected_total counter"
+        ]
+        lines += [f'photo_circuit_rejected_total{{upstream="{name}"}} {s["rejected"]}' for name, s in stats.items()]
+        return lines
+    return collect
+
+
+def queue_collector(get_stats: Callable[[], Dict[str, Any]]) -> Callable[[], List[str]]:
+    """Build a collector that exposes JobQueue.stats() as metrics."""
+    def collect() -> List[str]:
+        stats = get_stats()
+        return [
+            "# HELP photo_job_queue_depth Background jobs waiting for a worker.",
+            "# TYPE photo_job_queue_depth gauge",
+            f"photo_job_queue_depth {stats['depth']}",
+            "# HELP photo_job_workers_busy Background job workers currently running an evaluation.",
+            "# TYPE photo_job_workers_busy gauge",
+            f"photo_job_workers_busy {stats['busy_workers']}",
+            "# HELP photo_jobs_total Background jobs by outcome.",
+            "# TYPE photo_jobs_total counter",
+            f'photo_jobs_total{{outcome="submitted"}} {stats["submitted"]}',
+            f'photo_jobs_total{{outcome="rejected"}} {stats["rejected"]}',
+            f'photo_jobs_total{{outcome="completed"}} {stats["completed"]}',
+            f'photo_jobs_total{{outcome="failed"}} {stats["failed"]}'
+        ]
+    return collect
+
+
+def quota_collector(get_stats: Callable[[], Dict[str, Dict[str, Any]]]) -> Callable[[], List[str]]:
+    """Build a collector that exposes QuotaScheduler.stats() queue depths as metrics."""
+    def collect() -> List[str]:
+        stats = get_stats()
+        if not stats:
+            return []
+        lines = [
+            "# HELP photo_quota_queue_depth Calls currently queued for upstream quota.",
+            "# TYPE photo_quota_queue_depth gauge"
+        ]
+        lines += [f'photo_quota_queue_depth{{upstream="{name}"}} {s["queued"]}' for name, s in stats.items()]
+        return lines
+    return collect
+
+
+_llm_callback_class = None
+
+
+def make_llm_callback():
+    """Create a LangChain callback that times every LLM call and counts calls, tokens and parse retries.
+    
+    The class is built on first use so importing this module does not pull in LangChain.
+    Attach the same instance to the LLM and the agent run; LangChain skips duplicate handlers.
+    """
+    global _llm_callback_class
+    if _llm_callback_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+        
+        class LLMMetricsCallback(BaseCallbackHandler):
+            # Run inline so async invocations keep the request's trace context
+            run_inline = True
+            
+            def __init__(self):
+                self._started: Dict[Any, Tuple[float, str]] = {}
+            
+            def _start(self, run_id, tags) -> None:
+                kind = next((tag[len("kind:"):] for tag in tags or [] if tag.startswith("kind:")), "agent_step")
+                self._started[run_id] = (time.perf_counter(), kind)
+            
+            def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+                self._start(run_id, tags)
+            
+            def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+                self._start(run_id, tags)
+            
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                started, kind = self._started.pop(run_id, (None, "agent_step"))
+                if started is not None:
+                    observe_stage("llm", time.perf_counter() - started)
+                LLM_CALLS.inc(kind=kind)
+                for generations in response.generations:
+                    for generation in generations:
+                        usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                        if usage:
+                            LLM_TOKENS.inc(usage.get("input_tokens", 0), direction="input")
+                            LLM_TOKENS.inc(usage.get("output_tokens", 0), direction="output")
+            
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                started, kind = self._started.pop(run_id, (None, "agent_step"))
+                if started is not None:
+                    observe_stage("llm_error", time.perf_counter() - started)
+                LLM_CALLS.inc(kind=f"{kind}_error")
+            
+            def on_agent_action(self, action, *, run_id, **kwargs):
+                # handle_parsing_errors turns an unparseable reply into this pseudo-tool call
+                if action.tool == "_Exception":
+                    AGENT_PARSE_ERRORS.inc()
+        
+        _llm_callback_class = LLMMetricsCallback
+    return _llm_callback_class()
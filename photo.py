@@ -1,8 +1,18 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 import os
+import sys
+import json
+import time
+import argparse
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 from dotenv import load_dotenv
 from duckduckgo_search import DDGS  
+from cache import SQLiteTTLCache
+from compaction import compact_search_results, estimate_tokens, format_search_results
+from quota import BATCH, SEARCH, configure_scheduler, get_scheduler, request_priority
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -12,11 +22,18 @@ logger = logging.getLogger(__name__)
 # Load environment variables from .env file
 load_dotenv()
 
+# Query sent to DuckDuckGo; it is part of the cache key so changing it invalidates old entries
+SEARCH_QUERY_TEMPLATE = "{place_name} location type tourist information"
+SEARCH_MAX_RESULTS = 5
+
 class SnapPhotoThemeAgent:
     """Agent that recommends Snapchat photo themes for memorable places."""
     
-    def __init__(self):
-        """Initialize the Snapchat Photo Theme Agent with Google Gemini."""
+    def __init__(self, use_search_cache: bool = True, context_budget: Optional[int] = None):
+        """Initialize the Snapchat Photo Theme Agent with Google Gemini.
+        
+        context_budget caps the search context in the prompt, in estimated tokens; 0 sends it uncompacted.
+        """
         # Check for API key
         if not os.getenv("GOOGLE_API_KEY"):
             logger.error("GOOGLE_API_KEY environment variable is not set")
@@ -30,47 +47,105 @@ class SnapPhotoThemeAgent:
             )
             logger.info("Successfully initialized Google Gemini model")
             
+            # Gemini and search calls queue for this process's quota (see --quota-share)
+            self.quota = get_scheduler()
+            self.quota.attach(self.llm)
+            
             # Initialize DuckDuckGo search
             self.search_engine = DDGS()
             logger.info("Successfully initialized DuckDuckGo search")
+            
+            # Cache search results on disk so repeat lookups skip DuckDuckGo
+            self.search_cache = None
+            if use_search_cache:
+                self.search_cache = SQLiteTTLCache(
+                    os.getenv("SEARCH_CACHE_PATH", "search_cache.db"),
+                    maxsize=int(os.getenv("SEARCH_CACHE_SIZE", "10000")),
+                    ttl=float(os.getenv("SEARCH_CACHE_TTL", "604800")),
+                    name="search"
+                )
+                logger.info("Successfully initialized search cache")
+            
+            # Token budget for the search snippets that go into the evaluation prompt
+            if context_budget is None:
+                context_budget = int(os.getenv("SEARCH_CONTEXT_TOKENS", "300"))
+            self.context_budget = context_budget
         except Exception as e:
             logger.error(f"Failed to initialize: {str(e)}")
             raise
     
+    @staticmethod
+    def search_cache_key(place_name: str) -> str:
+        """Build the cache key from the normalized place name and the query template."""
+        normalized_name = " ".join(place_name.casefold().split())
+        return json.dumps([SEARCH_QUERY_TEMPLATE, SEARCH_MAX_RESULTS, normalized_name], ensure_ascii=False)
+    
+    def search_results(self, place_name: str) -> List[Dict[str, Any]]:
+        """Return DuckDuckGo results for the place, from the cache when available."""
+        cache_key = self.search_cache_key(place_name)
+        if self.search_cache is not None:
+            cached = self.search_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"Search cache hit for: {place_name}")
+                return cached
+        
+        # Search for the place with keywords that will help determine what kind of place it is
+        search_query = SEARCH_QUERY_TEMPLATE.format(place_name=place_name)
+        self.quota.acquire(SEARCH)
+        search_results = [
+            {"title": result.get("title", ""), "body": result.get("body", "")}
+            for result in self.search_engine.text(search_query, max_results=SEARCH_MAX_RESULTS)
+        ]
+        if self.search_cache is not None:
+            self.search_cache.set(cache_key, search_results)
+        return search_results
+    
     def search_place_info(self, place_name: str) -> str:
         """Search for information about the place using DuckDuckGo."""
+        return self.place_context(place_name)[0]
+    
+    def place_context(self, place_name: str) -> Tuple[str, Dict[str, int]]:
+        """Search for the place and return the prompt context with its token savings."""
         logger.info(f"Searching for information about: {place_name}")
         
         try:
-            # Search for the place with keywords that will help determine what kind of place it is
-            search_query = f"{place_name} location type tourist information"
-            search_results = list(self.search_engine.text(search_query, max_results=5))
+            search_results = self.search_results(place_name)
             
             if not search_results:
-                return "No information found about this place."
-            
-            # Combine the top search results
-            combined_info = "\n".join([
-                f"Title: {result['title']}\nDescription: {result['body']}"
-                for result in search_results
-            ])
+                return "No information found about this place.", {}
             
             logger.info(f"Found information about {place_name}")
-            return combined_info
+            return self.compact_context(search_results, place_name)
         except Exception as e:
             error_msg = f"Error searching for place information: {str(e)}"
             logger.error(error_msg)
-            return f"Failed to search for information about this place: {str(e)}"
+            return f"Failed to search for information about this place: {str(e)}", {}
     
-    def evaluate_photo_worthiness(self, place_name: str) -> str:
-        """Evaluate if a place is photo-worthy and suggest Snapchat themes."""
-        logger.info(f"Evaluating photo worthiness for: {place_name}")
+    def compact_context(self, search_results: List[Dict[str, Any]], place_name: str) -> Tuple[str, Dict[str, int]]:
+        """Dedupe and trim search results to the most relevant sentences within the token budget."""
+        combined_info = format_search_results(search_results)
+        if self.context_budget <= 0:
+            tokens = estimate_tokens(combined_info)
+            return combined_info, {"original_tokens": tokens, "compacted_tokens": tokens, "tokens_saved": 0}
         
-        # First, search for information about the place
-        place_info = self.search_place_info(place_name)
-        logger.info("Retrieved place information from search")
+        try:
+            compacted, stats = compact_search_results(search_results, place_name, self.context_budget)
+        except Exception as e:
+            # Compaction only saves tokens, so fall back to the full results rather than fail
+            logger.error(f"Failed to compact search results: {str(e)}")
+            tokens = estimate_tokens(combined_info)
+            return combined_info, {"original_tokens": tokens, "compacted_tokens": tokens, "tokens_saved": 0}
         
-        prompt = f"""
+        logger.info(
+            f"Compacted search context for {place_name}: {stats['original_tokens']} -> "
+            f"{stats['compacted_tokens']} tokens (saved {stats['tokens_saved']}, "
+            f"{stats['duplicates_removed']} duplicate sentences removed)"
+        )
+        return compacted, stats
+    
+    def build_evaluation_prompt(self, place_name: str, place_info: str) -> str:
+        """Build the Snapchat evaluation prompt from the search results."""
+        return f"""
         I need to evaluate if "{place_name}" is photo-worthy for Snapchat, focusing ONLY on entertainment, self-enjoyment, or creating memories.
         
         Here's information I found about this place:
@@ -91,6 +166,17 @@ class SnapPhotoThemeAgent:
         - Be specific to this exact location and its characteristics, not generic
         - Prioritize uniqueness and "shareability" on social media
         """
+    
+    def evaluate_photo_worthiness(self, place_name: str, place_info: Optional[str] = None) -> str:
+        """Evaluate if a place is photo-worthy and suggest Snapchat themes."""
+        logger.info(f"Evaluating photo worthiness for: {place_name}")
+        
+        # First, search for information about the place
+        if place_info is None:
+            place_info = self.search_place_info(place_name)
+        logger.info("Retrieved place information from search")
+        
+        prompt = self.build_evaluation_prompt(place_name, place_info)
         
         try:
             response = self.llm.invoke(prompt).content
@@ -100,13 +186,242 @@ class SnapPhotoThemeAgent:
             error_msg = f"Error generating recommendations: {str(e)}"
             logger.error(error_msg)
             return f"Sorry, I couldn't evaluate this place right now due to an error. Please try again later."
+    
+    def stream_photo_worthiness(self, place_name: str, place_info: Optional[str] = None) -> Iterator[str]:
+        """Evaluate a place like evaluate_photo_worthiness, yielding text as Gemini produces it."""
+        logger.info(f"Streaming photo worthiness evaluation for: {place_name}")
+        
+        if place_info is None:
+            place_info = self.search_place_info(place_name)
+        logger.info("Retrieved place information from search")
+        
+        prompt = self.build_evaluation_prompt(place_name, place_info)
+        
+        streamed_any = False
+        try:
+            for chunk in self.llm.stream(prompt):
+                if chunk.content:
+                    streamed_any = True
+                    yield chunk.content
+            logger.info(f"Finished streaming recommendations for {place_name}")
+        except Exception as e:
+            error_msg = f"Error generating recommendations: {str(e)}"
+            logger.error(error_msg)
+            if streamed_any:
+                yield "\n\n⚠️ The evaluation was cut short by an error. Please try again later."
+            else:
+                yield "Sorry, I couldn't evaluate this place right now due to an error. Please try again later."
+
+
+class RateLimiter:
+    """Thread-safe limiter that spaces calls at least 1/rate seconds apart."""
+    
+    def __init__(self, rate: float):
+        """Initialize the limiter with a maximum number of calls per second (0 disables it)."""
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def wait(self) -> None:
+        """Block until the caller may make its next call."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def read_place_names(source: Iterable[str]) -> List[str]:
+    """Read unique place names, one per line, skipping blanks and # comments."""
+    places = []
+    seen = set()
+    for line in source:
+        name = line.strip()
+        if not name or name.startswith("#") or name in seen:
+            continue
+        seen.add(name)
+        places.append(name)
+    return places
+
+
+def load_completed_places(output_path: str) -> Set[str]:
+    """Return places already evaluated successfully in an earlier, possibly partial, run."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be cut off if the previous run was interrupted
+                continue
+            if record.get("ok"):
+                completed.add(record["place"])
+    return completed
+
+
+def evaluate_place_record(agent: SnapPhotoThemeAgent, place_name: str, limiter: RateLimiter) -> Dict[str, Any]:
+    """Search and evaluate one place, returning a JSON-serializable result record."""
+    started = time.monotonic()
+    try:
+        limiter.wait()
+        # Batch priority only orders calls within this process; --quota-share keeps it off the server's quota
+        with request_priority(BATCH):
+            # Search directly rather than through place_context, so a failed search fails the record and is retried
+            search_results = agent.search_results(place_name)
+            if search_results:
+                place_info, context_stats = agent.compact_context(search_results, place_name)
+            else:
+                place_info, context_stats = "No information found about this place.", {}
+            prompt = agent.build_evaluation_prompt(place_name, place_info)
+            evaluation = agent.llm.invoke(prompt).content
+        return {
+            "place": place_name,
+            "ok": True,
+            "evaluation": evaluation,
+            "context_tokens_saved": context_stats.get("tokens_saved", 0),
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+    except Exception as e:
+        logger.error(f"Failed to evaluate {place_name}: {str(e)}")
+        return {
+            "place": place_name,
+            "ok": False,
+            "error": str(e),
+            "elapsed_s": round(time.monotonic() - started, 3)
+        }
+
+
+def run_batch(agent: SnapPhotoThemeAgent, places: List[str], output_path: Optional[str],
+              workers: int = 4, rate: float = 1.0) -> Dict[str, int]:
+    """Evaluate places on a bounded worker pool and append JSONL results in completion order.
+    
+    When output_path already holds results, places that succeeded there are skipped,
+    so an interrupted run can be resumed with the same command.
+    """
+    if output_path:
+        completed = load_completed_places(output_path)
+        pending = [place for place in places if place not in completed]
+        output = open(output_path, "a", encoding="utf-8")
+    else:
+        completed = set()
+        pending = places
+        output = sys.stdout
+    
+    logger.info(f"Batch: {len(pending)} places to evaluate, {len(places) - len(pending)} already done")
+    limiter = RateLimiter(rate)
+    write_lock = threading.Lock()
+    counts = {"total": len(places), "skipped": len(places) - len(pending), "ok": 0, "failed": 0, "tokens_saved": 0}
+    
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="batch")
+    try:
+        futures = [pool.submit(evaluate_place_record, agent, place, limiter) for place in pending]
+        for future in as_completed(futures):
+            record = future.result()
+            counts["ok" if record["ok"] else "failed"] += 1
+            counts["tokens_saved"] += record.get("context_tokens_saved", 0)
+            with write_lock:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+                output.flush()
+        pool.shutdown()
+    except BaseException as e:
+        # Drop the queued places so an interrupted run stops spending quota; only in-flight ones finish
+        if isinstance(e, KeyboardInterrupt):
+            logger.warning(f"Batch interrupted after {counts['ok'] + counts['failed']} places; rerun to resume")
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    
+    counts["quota_wait_s"] = round(sum(
+        sum(upstream["wait_seconds"].values()) for upstream in agent.quota.stats().values()
+    ), 3)
+    logger.info(f"Batch finished: {counts}")
+    return counts
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="Snapchat Photo Spot Evaluator")
+    parser.add_argument(
+        "--no-stream",
+        action="store_true",
+        help="wait for the full evaluation instead of printing it as it is generated"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always run a live DuckDuckGo search instead of using cached results"
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="FILE",
+        help="evaluate place names from FILE, one per line ('-' reads stdin), instead of prompting"
+    )
+    parser.add_argument(
+        "--output",
+        metavar="FILE",
+        help="append batch results to FILE as JSONL and resume from it if it exists (default: stdout)"
+    )
+    parser.add_argument(
+        "--context-tokens",
+        type=int,
+        default=None,
+        help="token budget for search context in the prompt, 0 to send it uncompacted "
+             "(default: SEARCH_CONTEXT_TOKENS or 300)"
+    )
+    parser.add_argument("--workers", type=int, default=4, help="number of concurrent batch workers (default: 4)")
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=1.0,
+        help="maximum evaluations started per second in batch mode, 0 for no limit (default: 1)"
+    )
+    parser.add_argument(
+        "--quota-share",
+        type=float,
+        default=None,
+        help="fraction of the QUOTA_* limits this run may use, leaving the rest to the server "
+             "(default: QUOTA_SHARE or 1)"
+    )
+    return parser.parse_args(argv)
+
+
+def main_batch(args: argparse.Namespace) -> None:
+    """Run batch mode over a file or stdin of place names."""
+    if args.batch == "-":
+        places = read_place_names(sys.stdin)
+    else:
+        with open(args.batch, "r", encoding="utf-8") as f:
+            places = read_place_names(f)
+    
+    agent = SnapPhotoThemeAgent(use_search_cache=not args.no_cache, context_budget=args.context_tokens)
+    counts = run_batch(agent, places, args.output, workers=args.workers, rate=args.rate)
+    print(
+        f"Evaluated {counts['ok']} places, {counts['failed']} failed, {counts['skipped']} already done; "
+        f"search context compaction saved about {counts['tokens_saved']} prompt tokens; "
+        f"{counts['quota_wait_s']}s spent waiting for quota.",
+        file=sys.stderr
+    )
 
 
 def main():
     """Main function to run the CLI application."""
+    args = parse_args()
+    if args.quota_share is not None:
+        configure_scheduler(args.quota_share)
+    if args.batch:
+        main_batch(args)
+        return
+    
     try:
         # Initialize the agent
-        agent = SnapPhotoThemeAgent()
+        agent = SnapPhotoThemeAgent(use_search_cache=not args.no_cache, context_budget=args.context_tokens)
         
         print("\n🌟 SNAPCHAT PHOTO SPOT EVALUATOR 🌟")
         print("=" * 60)
@@ -128,16 +443,27 @@ def main():
             
             # Show processing message
             print(f"\n🔍 Searching for information about {place_name}...")
+            place_info = agent.search_place_info(place_name)
             print(f"🔍 Evaluating {place_name} as a Snapchat photo spot...")
             
-            # Get evaluation and recommendations
-            result = agent.evaluate_photo_worthiness(place_name)
-            
-            # Print the recommendations
-            print("\n📱 SNAPCHAT SPOT EVALUATION 📱")
-            print("=" * 60)
-            print(result)
-            print("=" * 60)
+            if args.no_stream:
+                # Get evaluation and recommendations
+                result = agent.evaluate_photo_worthiness(place_name, place_info)
+                
+                # Print the recommendations
+                print("\n📱 SNAPCHAT SPOT EVALUATION 📱")
+                print("=" * 60)
+                print(result)
+                print("=" * 60)
+            else:
+                # Print the recommendations as they are generated
+                print("\n📱 SNAPCHAT SPOT EVALUATION 📱")
+                print("=" * 60)
+                for text in agent.stream_photo_worthiness(place_name, place_info):
+                    sys.stdout.write(text)
+                    sys.stdout.flush()
+                print()
+                print("=" * 60)
             
     except Exception as e:
         print(f"\n❌ An error occurred: {str(e)}")
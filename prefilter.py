@@ -0,0 +1,115 @@
+import os
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+REJECT = "reject"
+ACCEPT = "accept"
+AMBIGUOUS = "ambiguous"
+
+# Google Places types that are almost never a photo moment
+DEFAULT_REJECT_TYPES = {
+    "gas_station", "parking", "car_repair", "car_wash", "car_dealer", "car_rental", "atm", "bank",
+    "accounting", "insurance_agency", "lawyer", "real_estate_agency", "storage", "moving_company",
+    "laundry", "post_office", "plumber", "electrician", "locksmith", "roofing_contractor",
+    "painter", "dentist", "doctor", "physiotherapist", "hospital", "pharmacy", "veterinary_care",
+    "funeral_home", "police", "courthouse", "local_government_office", "convenience_store",
+    "hardware_store", "home_goods_store", "supermarket", "drugstore"
+}
+
+# Types that are worth a photo whenever the place is well rated or popular
+DEFAULT_ACCEPT_TYPES = {
+    "tourist_attraction", "museum", "art_gallery", "amusement_park", "aquarium", "zoo",
+    "natural_feature", "stadium"
+}
+
+# Emoji for the reminders written without the LLM
+TYPE_EMOJI = {
+    "tourist_attraction": "📸",
+    "museum": "🏛️",
+    "art_gallery": "🎨",
+    "amusement_park": "🎢",
+    "aquarium": "🐠",
+    "zoo": "🦁",
+    "natural_feature": "🏞️",
+    "stadium": "🏟️"
+}
+
+
+def _type_set(value: Optional[str], default: Set[str]) -> Set[str]:
+    """Parse a comma-separated type list from the environment, or return the default when unset or empty."""
+    if not value:
+        return set(default)
+    return {t.strip().lower() for t in value.split(",") if t.strip()}
+
+
+class PlacePrefilter:
+    """Rule-based verdict on a place's Places types, rating and popularity.
+
+    Places of a rejected type (and no accepted type) are turned down, and well-rated or
+    popular places of an accepted type get a templated reminder; only the rest need the LLM.
+    """
+
+    def __init__(self, reject_types: Optional[Iterable[str]] = None, accept_types: Optional[Iterable[str]] = None,
+                 min_accept_rating: float = 4.0):
+        """Initialize the rules; type lists default to DEFAULT_REJECT_TYPES and DEFAULT_ACCEPT_TYPES."""
+        self.reject_types = set(reject_types) if reject_types is not None else set(DEFAULT_REJECT_TYPES)
+        self.accept_types = set(accept_types) if accept_types is not None else set(DEFAULT_ACCEPT_TYPES)
+        self.min_accept_rating = min_accept_rating
+        self.counts = {REJECT: 0, ACCEPT: 0, AMBIGUOUS: 0}
+
+    @classmethod
+    def from_env(cls) -> Optional["PlacePrefilter"]:
+        """Build the prefilter from PREFILTER_* settings, or return None when it is disabled."""
+        if os.getenv("PREFILTER_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            reject_types=_type_set(os.getenv("PREFILTER_REJECT_TYPES"), DEFAULT_REJECT_TYPES),
+            accept_types=_type_set(os.getenv("PREFILTER_ACCEPT_TYPES"), DEFAULT_ACCEPT_TYPES),
+            min_accept_rating=float(os.getenv("PREFILTER_MIN_RATING", "4.0"))
+        )
+
+    @staticmethod
+    def place_types(place_info: Dict[str, Any]) -> Set[str]:
+        """Return all Places types of a place, falling back to its primary type."""
+        types = place_info.get("types") or [place_info.get("type", "unknown")]
+        return {str(t).lower() for t in types}
+
+    @staticmethod
+    def _preferred(types: Set[str], preferences: List[str]) -> bool:
+        """Return True if a preference names one of the place's types, e.g. "gas station"."""
+        wanted = {p.strip().lower().replace(" ", "_") for p in preferences}
+        return bool(types & wanted)
+
+    def classify(self, place_info: Dict[str, Any], preferences: Optional[List[str]] = None) -> str:
+        """Return REJECT, ACCEPT or AMBIGUOUS for a place; a type the user asked for is never rejected."""
+        types = self.place_types(place_info)
+        accepted = types & self.accept_types
+        if types & self.reject_types and not accepted and not self._preferred(types, preferences or []):
+            verdict = REJECT
+        elif accepted and (place_info.get("rating", 0) >= self.min_accept_rating or place_info.get("is_popular")):
+            verdict = ACCEPT
+        else:
+            verdict = AMBIGUOUS
+        self.counts[verdict] += 1
+        return verdict
+
+    def decide(self, place_info: Dict[str, Any], preferences: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+        """Return a {worthy, message} decision for clear cases, or None when the LLM should decide."""
+        verdict = self.classify(place_info, preferences)
+        name = place_info.get("name", "this place")
+        if verdict == REJECT:
+            logger.info(f"Prefilter rejected {name} ({place_info.get('type')})")
+            return {"worthy": False, "message": f"{name} is not worth a photo stop."}
+        if verdict == ACCEPT:
+            logger.info(f"Prefilter accepted {name} ({place_info.get('type')})")
+            accepted = sorted(self.place_types(place_info) & self.accept_types)
+            emoji = TYPE_EMOJI.get(accepted[0], "📸") if accepted else "📸"
+            return {"worthy": True, "message": f"{emoji} You're at {name}, don't miss a photo here!"}
+        return None
+
+    def stats(self) -> Dict[str, int]:
+        """Return verdict counts and how many LLM decisions the rules made unnecessary."""
+        return {**self.counts, "llm_calls_avoided": self.counts[REJECT] + self.counts[ACCEPT]}
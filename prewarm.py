@@ -0,0 +1,160 @@
+"""Build the tile index that lets /process-location answer known venues without Places or Gemini.
+
+Walks every geohash cell in a bounding box, resolves each cell's place with the agent's
+Places lookup, decides photo-worthiness and writes the reminder with the pipeline
+prompt for every preference set given, and stores the results in TILE_INDEX_PATH. Example:
+
+    python prewarm.py --bbox 40.758,-73.990,40.768,-73.975 --preferences "" --preferences "nature,art"
+
+Re-running skips cells that are already indexed, so an interrupted run can be resumed.
+"""
+import os
+import math
+import asyncio
+import argparse
+import logging
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from tiles import TileIndex
+from quota import PREWARM, configure_scheduler, request_priority
+
+# Set up logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+load_dotenv()
+
+METERS_PER_DEGREE_LAT = 111320.0
+
+
+def _steps(start: float, stop: float, step: float) -> Iterator[float]:
+    """Yield start, start + step, ... up to stop, always ending exactly on stop."""
+    value = start
+    while value < stop:
+        yield value
+        value += step
+    yield stop
+
+
+def grid_cells(bbox: Tuple[float, float, float, float], index: TileIndex,
+               step_m: Optional[float] = None) -> Dict[str, Tuple[float, float]]:
+    """Map each index cell in the bounding box to the first grid point that falls in it.
+    
+    By default the grid steps one cell at a time so every cell is visited exactly once;
+    step_m can only make the grid finer, never skip cells.
+    """
+    south, west, north, east = bbox
+    lat_step, lng_step = index.cell_size()
+    cells: Dict[str, Tuple[float, float]] = {}
+    for lat in _steps(south, north, lat_step if not step_m else min(lat_step, step_m / METERS_PER_DEGREE_LAT)):
+        meters_per_degree_lng = METERS_PER_DEGREE_LAT * max(math.cos(math.radians(lat)), 0.01)
+        for lng in _steps(west, east, lng_step if not step_m else min(lng_step, step_m / meters_per_degree_lng)):
+            point = (round(lat, 6), round(lng, 6))
+            cells.setdefault(index.cell(*point), point)
+    return cells
+
+
+async def prewarm_cell(agent, index: TileIndex, cell: str, point: Tuple[float, float],
+                       preference_sets: List[List[str]], counts: Dict[str, int]) -> None:
+    """Resolve one cell's place and store a decision for every preference set that is still missing."""
+    lat, lng = point
+    place_info = index.place(lat, lng)
+    if place_info is None:
+        place_info = await agent.get_place_details(lat, lng)
+        if "error" in place_info:
+            logger.error(f"Skipping cell {cell}: {place_info['error']}")
+            counts["errors"] += 1
+            return
+        index.put_place(cell, place_info)
+        counts["places"] += 1
+
+    for preferences in preference_sets:
+        if index.has_decision(cell, preferences):
+            continue
+        try:
+            decision = await agent.decide(place_info, preferences)
+        except Exception as e:
+            logger.error(f"Failed to decide for cell {cell} with preferences {preferences}: {str(e)}")
+            counts["errors"] += 1
+            continue
+        index.put_decision(cell, preferences, decision)
+        counts["decisions"] += 1
+
+
+async def prewarm(args: argparse.Namespace) -> Dict[str, int]:
+    """Walk the bounding box and fill the tile index."""
+    # Imported here so the index is not loaded into the agent that is building it
+    os.environ["TILE_INDEX_PATH"] = ""
+    from agent import AsyncPhotoReminderAgent, PIPELINE_MODE
+
+    index = TileIndex(args.index, precision=args.precision).load()
+    agent = AsyncPhotoReminderAgent(verbose=False, mode=PIPELINE_MODE)
+    preference_sets = [[p.strip() for p in value.split(",") if p.strip()] for value in args.preferences or [""]]
+
+    cells = grid_cells(args.bbox, index, args.step_m)
+    if len(cells) > args.max_cells:
+        raise SystemExit(f"Bounding box covers {len(cells)} cells, above --max-cells {args.max_cells}")
+    logger.info(f"Prewarming {len(cells)} cells for {len(preference_sets)} preference sets into {args.index}")
+
+    counts = {"cells": len(cells), "places": 0, "decisions": 0, "errors": 0}
+    semaphore = asyncio.Semaphore(max(1, args.concurrency))
+
+    async def run(cell: str, point: Tuple[float, float]) -> None:
+        async with semaphore:
+            await prewarm_cell(agent, index, cell, point, preference_sets, counts)
+
+    try:
+        # Lowest priority within this process; --quota-share keeps prewarming off the server's quota
+        with request_priority(PREWARM):
+            await asyncio.gather(*(run(cell, point) for cell, point in cells.items()))
+    finally:
+        await agent.aclose()
+        index.close()
+    return counts
+
+
+def parse_bbox(value: str) -> Tuple[float, float, float, float]:
+    """Parse 'south,west,north,east' into floats."""
+    try:
+        south, west, north, east = (float(part) for part in value.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("expected south,west,north,east")
+    if south > north or west > east:
+        raise argparse.ArgumentTypeError("south must not exceed north and west must not exceed east")
+    return south, west, north, east
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Precompute photo reminders for an area into the tile index")
+    parser.add_argument("--bbox", type=parse_bbox, required=True, help="area to cover as south,west,north,east")
+    parser.add_argument("--step-m", type=float, default=None,
+                        help="finer grid spacing in meters; by default the grid steps one index cell at a time")
+    parser.add_argument("--preferences", action="append",
+                        help="comma-separated preference set to precompute; repeat for several (default: none)")
+    parser.add_argument("--index", default=os.getenv("TILE_INDEX_PATH") or "tiles.db",
+                        help="index file (default: TILE_INDEX_PATH or tiles.db)")
+    parser.add_argument("--precision", type=int, default=int(os.getenv("PLACE_CACHE_PRECISION", "8")),
+                        help="geohash precision for a new index (default: PLACE_CACHE_PRECISION or 8)")
+    parser.add_argument("--concurrency", type=int, default=4, help="cells processed at once (default: 4)")
+    parser.add_argument("--max-cells", type=int, default=20000, help="refuse boxes with more cells (default: 20000)")
+    parser.add_argument("--quota-share", type=float, default=None,
+                        help="fraction of the QUOTA_* limits to use, leaving the rest to the server "
+                             "(default: QUOTA_SHARE or 1)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> Dict[str, int]:
+    args = parse_args(argv)
+    if args.quota_share is not None:
+        configure_scheduler(args.quota_share)
+    counts = asyncio.run(prewarm(args))
+    print(
+        f"Prewarmed {counts['cells']} cells: {counts['places']} new places, "
+        f"{counts['decisions']} new decisions, {counts['errors']} errors"
+    )
+    return counts
+
+
+if __name__ == "__main__":
+    main()
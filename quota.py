@@ -0,0 +1,430 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+from metrics import QUOTA_WAIT, QUOTA_TIMEOUTS
+from resilience import DeadlineExceeded, current_deadline
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Priority classes, most urgent first: users waiting on a response, then bulk work
+INTERACTIVE = "interactive"
+BATCH = "batch"
+PREWARM = "prewarm"
+PRIORITIES = (INTERACTIVE, BATCH, PREWARM)
+
+# Upstreams with their own quota
+GEMINI = "gemini"
+PLACES = "places"
+SEARCH = "search"
+
+# Stop queueing this long before the request deadline so the caller can still answer in time
+DEADLINE_MARGIN_SECONDS = 0.05
+
+
+class QuotaTimeout(DeadlineExceeded):
+    """Raised when a call waited for quota until its deadline; handled like any other deadline."""
+
+
+_current_priority: ContextVar[str] = ContextVar("photo_request_priority", default=INTERACTIVE)
+
+
+def current_priority() -> str:
+    """Return the priority class of the work running in this context."""
+    return _current_priority.get()
+
+
+@contextmanager
+def request_priority(priority: str):
+    """Run the enclosed calls (and tasks started from them) in a priority class."""
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}', expected one of {PRIORITIES}")
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Refills at a per-minute rate up to capacity; actual usage may push it into debt."""
+
+    def __init__(self, per_minute: float, burst_seconds: float = 6.0):
+        """Start full; capacity is burst_seconds worth of the rate, and at least one unit."""
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Return the seconds until amount is available (amounts above capacity wait for a full bucket)."""
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return missing / self.rate if missing > 0 else 0.0
+
+    def take(self, amount: float) -> None:
+        """Remove amount, going into debt if it exceeds the level."""
+        self.level -= amount
+
+
+class _Ticket:
+    """A caller waiting for quota, woken when it may check again."""
+
+    def __init__(self, priority: str, amount: float, loop: Optional[asyncio.AbstractEventLoop] = None):
+        self.priority = priority
+        self.amount = amount
+        self.loop = loop
+        self.event = asyncio.Event() if loop is not None else threading.Event()
+        self.enqueued_at = time.monotonic()
+
+    def wake(self) -> None:
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.event.set)
+        else:
+            self.event.set()
+
+
+class Upstream:
+    """Request and token buckets for one upstream, with the callers queued for them."""
+
+    def __init__(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0,
+                 burst_seconds: float = 6.0):
+        """Create the buckets; a limit of 0 leaves that dimension unlimited."""
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute > 0 else None
+        self.queue: List[Any] = []
+        self.granted = {priority: 0 for priority in PRIORITIES}
+        self.timeouts = {priority: 0 for priority in PRIORITIES}
+        self.wait_seconds = {priority: 0.0 for priority in PRIORITIES}
+        self.max_wait = {priority: 0.0 for priority in PRIORITIES}
+
+    @property
+    def limited(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Return the seconds until one request of the given token estimate fits both buckets."""
+        wait = self.requests.wait_time(1, now) if self.requests is not None else 0.0
+        if self.tokens is not None:
+            # Usage is only known afterwards, so the token bucket just has to be out of debt
+            wait = max(wait, self.tokens.wait_time(max(amount, 1.0), now))
+        return wait
+
+    def take(self, amount: float) -> None:
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None and amount:
+            self.tokens.take(amount)
+
+
+class QuotaScheduler:
+    """Admission control for Gemini, Places and search calls within one process.
+
+    Each upstream has a requests-per-minute and a tokens-per-minute bucket. Callers that
+    find the buckets empty queue instead of failing, and the queue is served strictly by
+    priority class (interactive before batch before prewarm), first come first served
+    within a class. A wait is bounded by the request deadline when one is set. Buckets are
+    not shared between processes, so each process should be given its own share of the quota.
+    """
+
+    def __init__(self, burst_seconds: float = 6.0):
+        """Initialize without limits; configure() sets them per upstream."""
+        self.burst_seconds = burst_seconds
+        self._upstreams: Dict[str, Upstream] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, share: Optional[float] = None) -> "QuotaScheduler":
+        """Build the scheduler from QUOTA_* settings; unset limits are unlimited.
+
+        share is the fraction of each limit this process may use, defaulting to QUOTA_SHARE.
+        """
+        if share is None:
+            share = float(os.getenv("QUOTA_SHARE", "1"))
+        if not 0 < share <= 1:
+            raise ValueError(f"Quota share must be in (0, 1], got {share}")
+        scheduler = cls(burst_seconds=float(os.getenv("QUOTA_BURST_SECONDS", "6")))
+        scheduler.configure(
+            GEMINI,
+            requests_per_minute=share * float(os.getenv("QUOTA_GEMINI_RPM", "0")),
+            tokens_per_minute=share * float(os.getenv("QUOTA_GEMINI_TPM", "0"))
+        )
+        scheduler.configure(PLACES, requests_per_minute=share * float(os.getenv("QUOTA_PLACES_RPM", "0")))
+        scheduler.configure(SEARCH, requests_per_minute=share * float(os.getenv("QUOTA_SEARCH_RPM", "0")))
+        return scheduler
+
+    def configure(self, name: str, requests_per_minute: float = 0, tokens_per_minute: float = 0) -> None:
+        """Set (or replace) the limits of an upstream."""
+        with self._lock:
+            self._upstreams[name] = Upstream(name, requests_per_minute, tokens_per_minute, self.burst_seconds)
+
+    def _upstream(self, name: str) -> Upstream:
+        with self._lock:
+            upstream = self._upstreams.get(name)
+            if upstream is None:
+                upstream = self._upstreams[name] = Upstream(name)
+            return upstream
+
+    @staticmethod
+    def _timeout(timeout: Optional[float]) -> Optional[float]:
+        """Default the wait bound to what is left of the current request deadline."""
+        if timeout is not None:
+            return timeout
+        deadline = current_deadline()
+        if deadline is None:
+            return None
+        return max(0.0, deadline.remaining() - DEADLINE_MARGIN_SECONDS)
+
+    def _enqueue(self, upstream: Upstream, ticket: _Ticket) -> None:
+        with self._lock:
+            heapq.heappush(upstream.queue, (PRIORITIES.index(ticket.priority), next(self._sequence), ticket))
+
+    def _try_grant(self, upstream: Upstream, ticket: _Ticket) -> Optional[float]:
+        """Grant the ticket if it is first in line and the buckets allow it.
+
+        Returns 0 when granted, the seconds to wait for a refill when first in line,
+        or None when other callers are ahead.
+        """
+        with self._lock:
+            if upstream.queue[0][2] is not ticket:
+                return None
+            wait = upstream.wait_time(ticket.amount, time.monotonic())
+            if wait > 0:
+                return wait
+            upstream.take(ticket.amount)
+            heapq.heappop(upstream.queue)
+            self._wake_head(upstream)
+            return 0.0
+
+    def _abandon(self, upstream: Upstream, ticket: _Ticket) -> None:
+        """Remove a ticket that timed out or was cancelled, letting the next caller move up."""
+        with self._lock:
+            upstream.queue = [entry for entry in upstream.queue if entry[2] is not ticket]
+            heapq.heapify(upstream.queue)
+            self._wake_head(upstream)
+
+    @staticmethod
+    def _wake_head(upstream: Upstream) -> None:
+        if upstream.queue:
+            upstream.queue[0][2].wake()
+
+    @staticmethod
+    def _sleep(wait: Optional[float], timeout: Optional[float], waited: float) -> Optional[float]:
+        """Return how long to sleep before checking again; None sleeps until woken."""
+        if timeout is None:
+            return wait
+        return min(wait, timeout - waited) if wait is not None else timeout - waited
+
+    def _record(self, upstream: Upstream, priority: str, waited: float) -> None:
+        with self._lock:
+            upstream.granted[priority] += 1
+            upstream.wait_seconds[priority] += waited
+            upstream.max_wait[priority] = max(upstream.max_wait[priority], waited)
+        QUOTA_WAIT.observe(waited, upstream=upstream.name, priority=priority)
+
+    def _timed_out(self, upstream: Upstream, ticket: _Ticket, waited: float) -> QuotaTimeout:
+        self._abandon(upstream, ticket)
+        with self._lock:
+            upstream.timeouts[ticket.priority] += 1
+        QUOTA_TIMEOUTS.inc(upstream=upstream.name, priority=ticket.priority)
+        logger.warning(f"Gave up waiting for {upstream.name} quota after {waited:.2f}s ({ticket.priority})")
+        return QuotaTimeout(f"Waited {waited:.2f}s for {upstream.name} quota")
+
+    def acquire(self, name: str, tokens: float = 0, priority: Optional[str] = None,
+                timeout: Optional[float] = None) -> float:
+        """Block until a call to the upstream may start and return the seconds waited.
+
+        tokens is an estimate of the call's tokens (0 when unknown; record_tokens settles
+        the actual usage). Raises QuotaTimeout if the wait would outlast the timeout,
+        which defaults to the current request deadline.
+        """
+        upstream = self._upstream(name)
+        priority = priority or current_priority()
+        if not upstream.limited:
+            self._record(upstream, priority, 0.0)
+            return 0.0
+
+        timeout = self._timeout(timeout)
+        ticket = _Ticket(priority, tokens)
+        self._enqueue(upstream, ticket)
+        try:
+            while True:
+                ticket.event.clear()
+                wait = self._try_grant(upstream, ticket)
+                waited = time.monotonic() - ticket.enqueued_at
+                if wait == 0:
+                    break
+                if timeout is not None and waited >= timeout:
+                    raise self._timed_out(upstream, ticket, waited)
+                ticket.event.wait(self._sleep(wait, timeout, waited))
+        except BaseException:
+            # A caller that stops waiting must not hold up the ones behind it
+            self._abandon(upstream, ticket)
+            raise
+        self._record(upstream, priority, waited)
+        return waited
+
+    async def aacquire(self, name: str, tokens: float = 0, priority: Optional[str] = None,
+                       timeout: Optional[float] = None) -> float:
+        """Async version of acquire; waiting does not block the event loop."""
+        upstream = self._upstream(name)
+        priority = priority or current_priority()
+        if not upstream.limited:
+            self._record(upstream, priority, 0.0)
+            return 0.0
+
+        timeout = self._timeout(timeout)
+        ticket = _Ticket(priority, tokens, asyncio.get_running_loop())
+        self._enqueue(upstream, ticket)
+        try:
+            while True:
+                ticket.event.clear()
+                wait = self._try_grant(upstream, ticket)
+                waited = time.monotonic() - ticket.enqueued_at
+                if wait == 0:
+                    break
+                if timeout is not None and waited >= timeout:
+                    raise self._timed_out(upstream, ticket, waited)
+                try:
+                    await asyncio.wait_for(ticket.event.wait(), self._sleep(wait, timeout, waited))
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self._abandon(upstream, ticket)
+            raise
+        self._record(upstream, priority, waited)
+        return waited
+
+    def record_tokens(self, name: str, tokens: float) -> None:
+        """Charge tokens reported by the upstream after a call to its token bucket."""
+        upstream = self._upstream(name)
+        if upstream.tokens is None or tokens <= 0:
+            return
+        with self._lock:
+            upstream.tokens.take(tokens)
+
+    def depth(self, name: str) -> int:
+        """Return how many callers are queued for an upstream."""
+        return len(self._upstream(name).queue)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-upstream limits, queue depth, and grants and waits per priority class."""
+        with self._lock:
+            upstreams = list(self._upstreams.values())
+        return {
+            upstream.name: {
+                "requests_per_minute": upstream.requests.rate * 60 if upstream.requests is not None else None,
+                "tokens_per_minute": upstream.tokens.rate * 60 if upstream.tokens is not None else None,
+                "queued": len(upstream.queue),
+                "granted": dict(upstream.granted),
+                "timeouts": dict(upstream.timeouts),
+                "wait_seconds": {p: round(s, 3) for p, s in upstream.wait_seconds.items()},
+                "max_wait_seconds": {p: round(s, 3) for p, s in upstream.max_wait.items()},
+                "mean_wait_seconds": {
+                    p: round(upstream.wait_seconds[p] / upstream.granted[p], 4) if upstream.granted[p] else 0.0
+                    for p in PRIORITIES
+                }
+            }
+            for upstream in upstreams
+        }
+
+    def llm_hooks(self, name: str = GEMINI):
+        """Return (rate_limiter, callback) that put a LangChain chat model under this upstream's quota.
+
+        The rate limiter queues every model call, including the ones the agent loop makes, and
+        the callback charges the token usage the model reports. Built on first use so importing
+        this module does not pull in LangChain.
+        """
+        global _llm_hook_classes
+        if _llm_hook_classes is None:
+            from langchain_core.callbacks import BaseCallbackHandler
+            from langchain_core.rate_limiters import BaseRateLimiter
+
+            class QuotaRateLimiter(BaseRateLimiter):
+                def __init__(self, scheduler: "QuotaScheduler", upstream: str):
+                    self.scheduler = scheduler
+                    self.upstream = upstream
+
+                def acquire(self, *, blocking: bool = True) -> bool:
+                    try:
+                        self.scheduler.acquire(self.upstream, timeout=None if blocking else 0)
+                    except QuotaTimeout:
+                        if blocking:
+                            raise
+                        return False
+                    return True
+
+                async def aacquire(self, *, blocking: bool = True) -> bool:
+                    try:
+                        await self.scheduler.aacquire(self.upstream, timeout=None if blocking else 0)
+                    except QuotaTimeout:
+                        if blocking:
+                            raise
+                        return False
+                    return True
+
+            class QuotaUsageCallback(BaseCallbackHandler):
+                run_inline = True
+
+                def __init__(self, scheduler: "QuotaScheduler", upstream: str):
+                    self.scheduler = scheduler
+                    self.upstream = upstream
+
+                def on_llm_end(self, response, *, run_id, **kwargs):
+                    for generations in response.generations:
+                        for generation in generations:
+                            usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                            self.scheduler.record_tokens(self.upstream, usage.get("total_tokens", 0))
+
+            _llm_hook_classes = (QuotaRateLimiter, QuotaUsageCallback)
+        limiter_class, callback_class = _llm_hook_classes
+        return limiter_class(self, name), callback_class(self, name)
+
+    def attach(self, llm, name: str = GEMINI) -> None:
+        """Put a chat model under the upstream's quota, unless it already has its own rate limiter."""
+        if getattr(llm, "rate_limiter", None) is not None:
+            return
+        limiter, callback = self.llm_hooks(name)
+        llm.rate_limiter = limiter
+        llm.callbacks = list(llm.callbacks or []) + [callback]
+
+
+_llm_hook_classes = None
+
+# The process-wide scheduler; every agent in a process shares its quota
+_scheduler: Optional[QuotaScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> QuotaScheduler:
+    """Return the process-wide scheduler, built from QUOTA_* on first use so settings loaded from .env apply."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = QuotaScheduler.from_env()
+        return _scheduler
+
+
+def configure_scheduler(share: float) -> QuotaScheduler:
+    """Rebuild the process-wide scheduler with the given share of the QUOTA_* limits.
+
+    Command-line tools call this before building their agents so they run next to the
+    server without exceeding the quota together.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        _scheduler = QuotaScheduler.from_env(share)
+        return _scheduler
@@ -0,0 +1,212 @@
+import time
+import asyncio
+import threading
+import logging
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request has no time budget left for another upstream call."""
+
+
+class CircuitOpenError(Exception):
+    """Raised when a circuit breaker is rejecting calls to a failing upstream."""
+
+
+class Deadline:
+    """Absolute time budget for one request, shared by every stage that runs on its behalf."""
+
+    def __init__(self, seconds: float):
+        """Start a budget of the given number of seconds from now."""
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        """Return the seconds left, never below zero."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        """Return True once the budget is used up."""
+        return self.remaining() <= 0
+
+    def timeout(self, cap: Optional[float] = None) -> float:
+        """Return the timeout for the next upstream call, capped at cap, or raise if none is left."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Request deadline of {self.seconds}s exceeded")
+        return min(remaining, cap) if cap is not None else remaining
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("photo_request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """Return the deadline of the request being processed in this context, if any."""
+    return _current_deadline.get()
+
+
+def set_deadline(deadline: Optional[Deadline]):
+    """Make a deadline current for this context (and tasks started from it); returns a reset token."""
+    return _current_deadline.set(deadline)
+
+
+def reset_deadline(token) -> None:
+    """Restore the deadline that was current before set_deadline."""
+    _current_deadline.reset(token)
+
+
+class CircuitBreaker:
+    """Fails fast after repeated upstream failures, then lets a single probe call through.
+
+    The breaker opens after failure_threshold consecutive failures, rejects calls for
+    reset_timeout seconds, and then half-opens: one call is allowed and its outcome
+    decides whether the breaker closes again or stays open for another period.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """Initialize a closed breaker."""
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return True if a call may go to the upstream now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            # A probe that never reported back (e.g. it was cancelled) must not block the breaker forever
+            probe_lost = time.monotonic() - self._probe_started >= self.reset_timeout
+            if self.state == self.HALF_OPEN and (not self._probe_in_flight or probe_lost):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def check(self) -> None:
+        """Raise CircuitOpenError if the call is not allowed."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self) -> None:
+        """Close the breaker after a successful call."""
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"{self.name} circuit closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        """Count a failed call and open the breaker once the threshold is reached."""
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"{self.name} circuit opened after {self.failures} consecutive failures")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the breaker state for diagnostics."""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "rejected": self.rejected
+        }
+
+
+async def hedged(call: Callable[[], Awaitable[Any]], hedge_after: Optional[float]) -> Any:
+    """Await call(), starting one duplicate attempt if the first is still running after hedge_after seconds.
+
+    The first attempt to succeed wins and the other is cancelled. If one attempt fails the
+    other is still awaited, so a hedge also acts as a retry. Without hedge_after this is a plain await.
+    """
+    if not hedge_after or hedge_after <= 0:
+        return await call()
+
+    attempts = {asyncio.ensure_future(call())}
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=hedge_after)
+        if not done:
+            logger.info(f"Hedging a slow upstream call after {hedge_after}s")
+            attempts.add(asyncio.ensure_future(call()))
+
+        error: Optional[BaseException] = None
+        while attempts:
+            done, attempts = await asyncio.wait(attempts, return_when=asyncio.FIRST_COMPLETED)
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+                error = attempt.exception()
+        raise error
+    finally:
+        # Also runs when the caller is cancelled, e.g. by the request deadline
+        for attempt in attempts:
+            attempt.cancel()
+
+
+_breaker_callback_class = None
+
+
+def make_breaker_callback(breaker: CircuitBreaker):
+    """Create a LangChain callback that reports each agent-step LLM call to the breaker.
+
+    Only untagged calls, i.e. the agent's own reasoning steps, are counted; calls tagged
+    kind:... already report through the agent's invoke helpers. Cancellations and deadline
+    or quota timeouts say nothing about the upstream and are ignored. The class is built
+    on first use so importing this module does not pull in LangChain.
+    """
+    global _breaker_callback_class
+    if _breaker_callback_class is None:
+        from langchain_core.callbacks import BaseCallbackHandler
+
+        class BreakerCallback(BaseCallbackHandler):
+            run_inline = True
+
+            def __init__(self, breaker: CircuitBreaker):
+                self.breaker = breaker
+                self._runs = set()
+
+            def _start(self, run_id, tags) -> None:
+                if not any(tag.startswith("kind:") for tag in tags or []):
+                    self._runs.add(run_id)
+
+            def on_chat_model_start(self, serialized, messages, *, run_id, tags=None, **kwargs):
+                self._start(run_id, tags)
+
+            def on_llm_start(self, serialized, prompts, *, run_id, tags=None, **kwargs):
+                self._start(run_id, tags)
+
+            def on_llm_end(self, response, *, run_id, **kwargs):
+                if run_id in self._runs:
+                    self._runs.discard(run_id)
+                    self.breaker.record_success()
+
+            def on_llm_error(self, error, *, run_id, **kwargs):
+                if run_id in self._runs:
+                    self._runs.discard(run_id)
+                    if not isinstance(error, (DeadlineExceeded, asyncio.CancelledError)):
+                        self.breaker.record_failure()
+
+        _breaker_callback_class = BreakerCallback
+    return _breaker_callback_class(breaker)
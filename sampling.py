@@ -0,0 +1,163 @@
+import os
+import json
+import math
+import time
+import logging
+from typing import Any, Dict, List, Optional
+from cache import TTLCache
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+STATIONARY = "stationary"
+WALKING = "walking"
+DRIVING = "driving"
+UNKNOWN = "unknown"
+
+# Speeds in meters per second that separate dwelling, walking and driving
+WALKING_SPEED = 0.5
+DRIVING_SPEED = 7.0
+
+
+def distance_meters(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Return the great-circle distance between two coordinates in meters."""
+    d_lat = math.radians(lat2 - lat1)
+    d_lng = math.radians(lng2 - lng1)
+    h = math.sin(d_lat / 2) ** 2 + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lng / 2) ** 2
+    return 2 * 6371000 * math.asin(math.sqrt(h))
+
+
+class SamplingPolicy:
+    """Decides per client whether a position needs a fresh evaluation and when to check again.
+
+    Recent positions give the client's speed, classified as stationary, walking or driving.
+    A position within same_place_meters of the last evaluation (with the same preferences
+    and mode) is skipped, and every consecutive skip doubles the suggested wait up to
+    max_interval. Moving clients are asked to check again sooner, so arriving somewhere
+    new is noticed within one moving interval.
+    """
+
+    def __init__(self, same_place_meters: float = 50.0, window_seconds: float = 300.0,
+                 moving_interval: float = 60.0, driving_interval: float = 120.0,
+                 dwell_interval: float = 120.0, max_interval: float = 900.0,
+                 max_clients: int = 10000, max_positions: int = 20):
+        """Initialize the policy; intervals are in seconds."""
+        self.same_place_meters = same_place_meters
+        self.window_seconds = window_seconds
+        self.max_positions = max(2, max_positions)
+        self.moving_interval = moving_interval
+        self.driving_interval = driving_interval
+        self.dwell_interval = dwell_interval
+        self.max_interval = max_interval
+        self.skipped = 0
+        self.evaluated = 0
+        # Client state outlives the longest suggested wait, so a dwelling client is still known
+        self.clients = TTLCache(maxsize=max_clients, ttl=max(3600.0, 2 * max_interval), name="sampling")
+
+    @classmethod
+    def from_env(cls) -> Optional["SamplingPolicy"]:
+        """Build the policy from SAMPLING_* settings, or return None when it is disabled."""
+        if os.getenv("SAMPLING_ENABLED", "true").lower() not in ("1", "true", "yes"):
+            return None
+        return cls(
+            same_place_meters=float(os.getenv("SAMPLING_SAME_PLACE_METERS", "50")),
+            moving_interval=float(os.getenv("SAMPLING_MOVING_INTERVAL", "60")),
+            driving_interval=float(os.getenv("SAMPLING_DRIVING_INTERVAL", "120")),
+            dwell_interval=float(os.getenv("SAMPLING_DWELL_INTERVAL", "120")),
+            max_interval=float(os.getenv("SAMPLING_MAX_INTERVAL", "900")),
+            max_clients=int(os.getenv("SAMPLING_MAX_CLIENTS", "10000"))
+        )
+
+    @staticmethod
+    def evaluation_key(preferences: List[str], mode: Optional[str]) -> str:
+        """Normalize what, besides the position, makes an evaluation reusable."""
+        return json.dumps([sorted({p.strip().lower() for p in preferences if p.strip()}), mode], ensure_ascii=False)
+
+    def _speed(self, positions: List[List[float]]) -> Optional[float]:
+        """Return the average speed over the recent positions, or None with too little history."""
+        if len(positions) < 2:
+            return None
+        first, last = positions[0], positions[-1]
+        elapsed = last[0] - first[0]
+        if elapsed < 1:
+            return None
+        return distance_meters(first[1], first[2], last[1], last[2]) / elapsed
+
+    @staticmethod
+    def _motion(speed: Optional[float]) -> str:
+        if speed is None:
+            return UNKNOWN
+        if speed < WALKING_SPEED:
+            return STATIONARY
+        if speed < DRIVING_SPEED:
+            return WALKING
+        return DRIVING
+
+    def _interval(self, motion: str, skips: int) -> float:
+        """Return the suggested seconds until the next check."""
+        if motion == DRIVING:
+            return self.driving_interval
+        if skips:
+            return min(self.dwell_interval * 2 ** (skips - 1), self.max_interval)
+        if motion == STATIONARY:
+            return self.dwell_interval
+        return self.moving_interval
+
+    def observe(self, client_id: Optional[str], latitude: float, longitude: float, preferences: List[str],
+                mode: Optional[str] = None, force: bool = False, now: Optional[float] = None) -> Dict[str, Any]:
+        """Record a position and return {skip, motion, speed_mps, next_check_after} for it.
+
+        Without a client id nothing is tracked and the position is always evaluated;
+        force evaluates even at the same place.
+        """
+        now = now if now is not None else time.time()
+        if not client_id:
+            self.evaluated += 1
+            return {"skip": False, "motion": UNKNOWN, "speed_mps": None, "next_check_after": int(self.moving_interval)}
+
+        state = self.clients.get(client_id) or {"positions": [], "last_evaluation": None, "skips": 0}
+        recent = [p for p in state["positions"] if now - p[0] <= self.window_seconds][-(self.max_positions - 1):]
+        positions = recent + [[now, latitude, longitude]]
+        speed = self._speed(positions)
+        motion = self._motion(speed)
+
+        key = self.evaluation_key(preferences, mode)
+        last = state["last_evaluation"]
+        skip = (
+            not force and last is not None and last["key"] == key
+            and now - last["time"] < self.max_interval
+            and distance_meters(last["lat"], last["lng"], latitude, longitude) <= self.same_place_meters
+        )
+        if skip:
+            state["skips"] += 1
+            self.skipped += 1
+        else:
+            state["last_evaluation"] = {"lat": latitude, "lng": longitude, "key": key, "time": now}
+            state["skips"] = 0
+            self.evaluated += 1
+
+        state["positions"] = positions
+        self.clients.set(client_id, state)
+        return {
+            "skip": skip,
+            "motion": motion,
+            "speed_mps": round(speed, 2) if speed is not None else None,
+            "next_check_after": int(self._interval(motion, state["skips"]))
+        }
+
+    def forget_evaluation(self, client_id: Optional[str]) -> None:
+        """Drop the client's last evaluation, e.g. after it failed, so the next position is evaluated."""
+        state = self.clients.get(client_id) if client_id else None
+        if state is not None:
+            state["last_evaluation"] = None
+            state["skips"] = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return how many positions were evaluated or skipped, and how many clients are tracked."""
+        total = self.skipped + self.evaluated
+        return {
+            "clients": len(self.clients),
+            "evaluated": self.evaluated,
+            "skipped": self.skipped,
+            "skip_rate": round(self.skipped / total, 4) if total else 0.0
+        }
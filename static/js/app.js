@@ -14,57 +14,166 @@ function updateNotificationCount() {
     }
 }
 
+// Show a browser notification if the user allowed them
+function showNotification(message) {
+    if ("Notification" in window && Notification.permission === "granted") {
+        new Notification("📸 PhotoRemind", { body: message });
+    }
+}
+
+// Insert a reminder pushed or returned by the server
+function addReminder(reminder, html) {
+    document.getElementById('reminders-container').insertAdjacentHTML('beforeend', html);
+    showNotification(reminder.message);
+    activeReminders.push(reminder);
+    updateNotificationCount();
+}
+
 // Set up periodic location checking (if enabled)
-let locationCheckInterval = null;
+let locationCheckTimer = null;
+let locationWatchId = null;
+let reminderEvents = null;
+let lastSentPosition = null;
+
+// Only push a new position when the user moved this far or the server's check-again hint passed
+const MIN_PUSH_DISTANCE_METERS = 50;
+let nextPushAfterMs = 60 * 1000;
+
+// The server answers every check with next_check_after (seconds), based on whether the user dwells or moves
+function nextCheckDelayMs(data, fallbackMs) {
+    return data && data.next_check_after ? data.next_check_after * 1000 : fallbackMs;
+}
+
+function distanceMeters(a, b) {
+    const toRad = deg => deg * Math.PI / 180;
+    const dLat = toRad(b.lat - a.lat);
+    const dLng = toRad(b.lng - a.lng);
+    const h = Math.sin(dLat / 2) ** 2 +
+              Math.cos(toRad(a.lat)) * Math.cos(toRad(b.lat)) * Math.sin(dLng / 2) ** 2;
+    return 2 * 6371000 * Math.asin(Math.sqrt(h));
+}
+
+function pushLocation(position) {
+    const current = {
+        lat: position.coords.latitude,
+        lng: position.coords.longitude,
+        time: Date.now()
+    };
+    if (lastSentPosition &&
+        distanceMeters(lastSentPosition, current) < MIN_PUSH_DISTANCE_METERS &&
+        current.time - lastSentPosition.time < nextPushAfterMs) {
+        return;
+    }
+    lastSentPosition = current;
+    
+    document.getElementById('latitude').value = current.lat;
+    document.getElementById('longitude').value = current.lng;
+    
+    const formData = new FormData();
+    formData.append('latitude', current.lat);
+    formData.append('longitude', current.lng);
+    formData.append('preferences', document.getElementById('preferences').value);
+    
+    // The server evaluates in the background and answers on the event stream
+    fetch('/location-update', {
+        method: 'POST',
+        body: formData
+    })
+    .then(response => response.json())
+    .then(data => {
+        nextPushAfterMs = nextCheckDelayMs(data, nextPushAfterMs);
+    })
+    .catch(error => console.error('Error pushing location:', error));
+}
 
 function startLocationChecking(intervalMinutes = 15) {
-    // Clear any existing interval
-    if (locationCheckInterval) {
-        clearInterval(locationCheckInterval);
+    if (!navigator.geolocation) {
+        return;
     }
     
-    // Set up new interval
-    locationCheckInterval = setInterval(() => {
-        if (navigator.geolocation) {
-            navigator.geolocation.getCurrentPosition(position => {
-                const lat = position.coords.latitude;
-                const lng = position.coords.longitude;
-                const preferences = document.getElementById('preferences').value;
-                
-                // Automatically submit the form with the current location
-                document.getElementById('latitude').value = lat;
-                document.getElementById('longitude').value = lng;
-                
-                // Create FormData and submit
-                const formData = new FormData();
-                formData.append('latitude', lat);
-                formData.append('longitude', lng);
-                formData.append('preferences', preferences);
-                
-                fetch('/process-location', {
-                    method: 'POST',
-                    body: formData
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.success && data.reminder) {
-                        // Insert the new reminder HTML
-                        document.getElementById('reminders-container').insertAdjacentHTML('beforeend', data.html);
-                        
-                        // Show browser notification
-                        showNotification(data.reminder.message);
-                        
-                        // Add to active reminders
-                        activeReminders.push(data.reminder);
-                        updateNotificationCount();
-                    }
-                })
-                .catch(error => console.error('Error checking location:', error));
+    if (window.EventSource) {
+        startLocationPush();
+    } else {
+        startLocationPolling(intervalMinutes);
+    }
+}
+
+// Push position changes and receive reminders over server-sent events
+function startLocationPush() {
+    if (reminderEvents) {
+        reminderEvents.close();
+    }
+    if (locationWatchId !== null) {
+        navigator.geolocation.clearWatch(locationWatchId);
+    }
+    
+    reminderEvents = new EventSource('/events');
+    reminderEvents.addEventListener('reminder', event => {
+        const data = JSON.parse(event.data);
+        addReminder(data.reminder, data.html);
+    });
+    
+    locationWatchId = navigator.geolocation.watchPosition(
+        pushLocation,
+        error => console.error('Error watching location:', error),
+        { enableHighAccuracy: false, maximumAge: 30000 }
+    );
+    
+    console.log('Location push started');
+}
+
+// Fallback for browsers without EventSource: poll, waiting as long as the server suggests
+function startLocationPolling(intervalMinutes) {
+    // Clear any pending check
+    if (locationCheckTimer) {
+        clearTimeout(locationCheckTimer);
+    }
+    
+    const fallbackMs = intervalMinutes * 60 * 1000; // Convert minutes to milliseconds
+    
+    const scheduleCheck = delayMs => {
+        locationCheckTimer = setTimeout(checkLocation, delayMs);
+    };
+    
+    const checkLocation = () => {
+        navigator.geolocation.getCurrentPosition(position => {
+            const lat = position.coords.latitude;
+            const lng = position.coords.longitude;
+            const preferences = document.getElementById('preferences').value;
+            
+            // Automatically submit the form with the current location
+            document.getElementById('latitude').value = lat;
+            document.getElementById('longitude').value = lng;
+            
+            // Create FormData and submit
+            const formData = new FormData();
+            formData.append('latitude', lat);
+            formData.append('longitude', lng);
+            formData.append('preferences', preferences);
+            
+            fetch('/process-location', {
+                method: 'POST',
+                body: formData
+            })
+            .then(response => response.json())
+            .then(data => {
+                if (data.success && data.reminder) {
+                    addReminder(data.reminder, data.html);
+                }
+                scheduleCheck(nextCheckDelayMs(data, fallbackMs));
+            })
+            .catch(error => {
+                console.error('Error checking location:', error);
+                scheduleCheck(fallbackMs);
             });
-        }
-    }, intervalMinutes * 60 * 1000); // Convert minutes to milliseconds
+        }, error => {
+            console.error('Error getting location:', error);
+            scheduleCheck(fallbackMs);
+        });
+    };
     
-    console.log(`Location checking started (every ${intervalMinutes} minutes)`);
+    checkLocation();
+    console.log(`Location checking started (paced by the server, every ${intervalMinutes} minutes without a hint)`);
 }
 
 // Function to enable background tracking
@@ -0,0 +1,214 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import logging
+from itertools import islice
+from typing import Any, Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+DEFAULT_CLIENT_ID = "anonymous"
+
+
+class ReminderStore:
+    """Storage interface for active photo reminders, partitioned by client."""
+
+    def add(self, client_id: str, message: str, latitude: float, longitude: float,
+            preferences: List[str]) -> Dict[str, Any]:
+        """Store a new reminder and return it with its assigned id."""
+        raise NotImplementedError
+
+    def get(self, reminder_id: int) -> Optional[Dict[str, Any]]:
+        """Return a reminder by id, or None if it does not exist."""
+        raise NotImplementedError
+
+    def delete(self, client_id: str, reminder_id: int) -> bool:
+        """Delete one of a client's reminders by id and report whether it existed."""
+        raise NotImplementedError
+
+    def list(self, client_id: str, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return one page of a client's reminders, oldest first."""
+        raise NotImplementedError
+
+    def count(self, client_id: str) -> int:
+        """Return how many reminders a client has."""
+        raise NotImplementedError
+
+    def latest_id(self, client_id: str) -> int:
+        """Return the id of the client's newest reminder, or -1 if it has none."""
+        raise NotImplementedError
+
+    def list_after(self, client_id: str, after_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        """Return the client's reminders with ids above after_id, oldest first."""
+        raise NotImplementedError
+
+
+class InMemoryReminderStore(ReminderStore):
+    """Process-local reminder store, mainly for tests and single-worker development."""
+
+    def __init__(self):
+        """Initialize empty id and per-client indexes."""
+        self._next_id = 0
+        self._by_id: Dict[int, Dict[str, Any]] = {}
+        self._by_client: Dict[str, Dict[int, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, client_id: str, message: str, latitude: float, longitude: float,
+            preferences: List[str]) -> Dict[str, Any]:
+        with self._lock:
+            reminder = {
+                "id": self._next_id,
+                "client_id": client_id,
+                "message": message,
+                "latitude": latitude,
+                "longitude": longitude,
+                "preferences": list(preferences),
+                "created_at": time.time()
+            }
+            self._next_id += 1
+            self._by_id[reminder["id"]] = reminder
+            self._by_client.setdefault(client_id, {})[reminder["id"]] = reminder
+            return dict(reminder)
+
+    def get(self, reminder_id: int) -> Optional[Dict[str, Any]]:
+        reminder = self._by_id.get(reminder_id)
+        return dict(reminder) if reminder else None
+
+    def delete(self, client_id: str, reminder_id: int) -> bool:
+        with self._lock:
+            reminder = self._by_id.get(reminder_id)
+            if reminder is None or reminder["client_id"] != client_id:
+                return False
+            del self._by_id[reminder_id]
+            self._by_client.get(client_id, {}).pop(reminder_id, None)
+            return True
+
+    def list(self, client_id: str, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            reminders = self._by_client.get(client_id, {}).values()
+            return [dict(r) for r in islice(reminders, offset, offset + limit)]
+
+    def count(self, client_id: str) -> int:
+        return len(self._by_client.get(client_id, {}))
+
+    def latest_id(self, client_id: str) -> int:
+        with self._lock:
+            return max(self._by_client.get(client_id, {}), default=-1)
+
+    def list_after(self, client_id: str, after_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        with self._lock:
+            reminders = (r for r in self._by_client.get(client_id, {}).values() if r["id"] > after_id)
+            return [dict(r) for r in islice(reminders, limit)]
+
+
+class SQLiteReminderStore(ReminderStore):
+    """SQLite-backed reminder store that several uvicorn workers can share.
+
+    The database runs in WAL mode so readers never block the single writer,
+    and ids come from AUTOINCREMENT so they are never reused after a delete.
+    """
+
+    def __init__(self, path: str = "reminders.db"):
+        """Open the database and create the schema if needed."""
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS reminders (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                latitude REAL NOT NULL,
+                longitude REAL NOT NULL,
+                preferences TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_reminders_client ON reminders (client_id, id);
+        """)
+        logger.info(f"Using SQLite reminder store at {self.path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_reminder(row: sqlite3.Row) -> Dict[str, Any]:
+        reminder = dict(row)
+        reminder["preferences"] = json.loads(reminder["preferences"])
+        return reminder
+
+    def add(self, client_id: str, message: str, latitude: float, longitude: float,
+            preferences: List[str]) -> Dict[str, Any]:
+        created_at = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO reminders (client_id, message, latitude, longitude, preferences, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (client_id, message, latitude, longitude, json.dumps(list(preferences)), created_at)
+        )
+        return {
+            "id": cursor.lastrowid,
+            "client_id": client_id,
+            "message": message,
+            "latitude": latitude,
+            "longitude": longitude,
+            "preferences": list(preferences),
+            "created_at": created_at
+        }
+
+    def get(self, reminder_id: int) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT * FROM reminders WHERE id = ?", (reminder_id,)
+        ).fetchone()
+        return self._row_to_reminder(row) if row else None
+
+    def delete(self, client_id: str, reminder_id: int) -> bool:
+        cursor = self._connection().execute(
+            "DELETE FROM reminders WHERE id = ? AND client_id = ?", (reminder_id, client_id)
+        )
+        return cursor.rowcount > 0
+
+    def list(self, client_id: str, offset: int = 0, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT * FROM reminders WHERE client_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (client_id, limit, offset)
+        ).fetchall()
+        return [self._row_to_reminder(row) for row in rows]
+
+    def count(self, client_id: str) -> int:
+        return self._connection().execute(
+            "SELECT COUNT(*) FROM reminders WHERE client_id = ?", (client_id,)
+        ).fetchone()[0]
+
+    def latest_id(self, client_id: str) -> int:
+        row = self._connection().execute(
+            "SELECT MAX(id) FROM reminders WHERE client_id = ?", (client_id,)
+        ).fetchone()
+        return row[0] if row[0] is not None else -1
+
+    def list_after(self, client_id: str, after_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        rows = self._connection().execute(
+            "SELECT * FROM reminders WHERE client_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (client_id, after_id, limit)
+        ).fetchall()
+        return [self._row_to_reminder(row) for row in rows]
+
+
+def create_reminder_store() -> ReminderStore:
+    """Build the reminder store selected by REMINDER_STORE ("sqlite" or "memory")."""
+    backend = os.getenv("REMINDER_STORE", "sqlite").lower()
+    if backend == "memory":
+        logger.info("Using in-memory reminder store")
+        return InMemoryReminderStore()
+    if backend == "sqlite":
+        return SQLiteReminderStore(os.getenv("REMINDER_DB_PATH", "reminders.db"))
+    raise ValueError(f"Unknown REMINDER_STORE '{backend}', expected 'sqlite' or 'memory'")
@@ -0,0 +1,146 @@
+import json
+import time
+import sqlite3
+import threading
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from cache import geohash_encode
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class TileIndex:
+    """Precomputed places and photo decisions per geohash cell, built offline by prewarm.py.
+
+    The index lives in a small SQLite file and is loaded into memory on startup, so a
+    lookup is a dictionary access. Decisions are stored per normalized preference set,
+    because the same place can be worth a photo for one user and not another.
+    """
+
+    def __init__(self, path: str, precision: int = 8, max_age: Optional[float] = None):
+        """Open or create the index file; an existing file keeps the precision it was built with."""
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._places: Dict[str, Dict[str, Any]] = {}
+        self._decisions: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS places (
+                cell TEXT PRIMARY KEY,
+                place TEXT NOT NULL,
+                created_at REAL NOT NULL
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS decisions (
+                cell TEXT NOT NULL,
+                preferences TEXT NOT NULL,
+                worthy INTEGER NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (cell, preferences)
+            ) WITHOUT ROWID;
+        """)
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'precision'").fetchone()
+        if row is None:
+            self._conn.execute("INSERT INTO meta (key, value) VALUES ('precision', ?)", (str(precision),))
+            self.precision = precision
+        else:
+            self.precision = int(row[0])
+
+    @staticmethod
+    def preferences_key(preferences: List[str]) -> str:
+        """Normalize a preference list the same way the reminder cache does."""
+        return json.dumps(sorted({p.strip().lower() for p in preferences if p.strip()}), ensure_ascii=False)
+
+    def cell(self, latitude: float, longitude: float) -> str:
+        """Return the index cell for a coordinate."""
+        return geohash_encode(latitude, longitude, self.precision)
+
+    def cell_size(self) -> Tuple[float, float]:
+        """Return the (latitude, longitude) size of an index cell in degrees."""
+        bits = 5 * self.precision
+        return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** (bits - bits // 2)
+
+    def load(self) -> "TileIndex":
+        """Read the index into memory, skipping entries older than max_age."""
+        oldest = time.time() - self.max_age if self.max_age else 0
+        with self._lock:
+            self._places = {
+                cell: json.loads(place)
+                for cell, place in self._conn.execute(
+                    "SELECT cell, place FROM places WHERE created_at >= ?", (oldest,)
+                )
+            }
+            self._decisions = {
+                (cell, preferences): {"worthy": bool(worthy), "message": message}
+                for cell, preferences, worthy, message in self._conn.execute(
+                    "SELECT cell, preferences, worthy, message FROM decisions WHERE created_at >= ?", (oldest,)
+                )
+            }
+        logger.info(
+            f"Loaded tile index {self.path}: {len(self._places)} places, "
+            f"{len(self._decisions)} decisions (precision {self.precision})"
+        )
+        return self
+
+    def lookup(self, latitude: float, longitude: float, preferences: List[str]) -> Optional[Dict[str, Any]]:
+        """Return the precomputed {worthy, message} decision for a coordinate and preferences, if any."""
+        decision = self._decisions.get((self.cell(latitude, longitude), self.preferences_key(preferences)))
+        if decision is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return decision
+
+    def place(self, latitude: float, longitude: float) -> Optional[Dict[str, Any]]:
+        """Return the precomputed place details for a coordinate, if any."""
+        place = self._places.get(self.cell(latitude, longitude))
+        return dict(place) if place is not None else None
+
+    def put_place(self, cell: str, place_info: Dict[str, Any]) -> None:
+        """Store the resolved place for a cell."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO places (cell, place, created_at) VALUES (?, ?, ?)",
+                (cell, json.dumps(place_info, ensure_ascii=False), time.time())
+            )
+            self._places[cell] = dict(place_info)
+
+    def put_decision(self, cell: str, preferences: List[str], decision: Dict[str, Any]) -> None:
+        """Store the decision for a cell and preference set."""
+        key = self.preferences_key(preferences)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO decisions (cell, preferences, worthy, message, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (cell, key, int(bool(decision["worthy"])), decision["message"], time.time())
+            )
+            self._decisions[(cell, key)] = {"worthy": bool(decision["worthy"]), "message": decision["message"]}
+
+    def has_decision(self, cell: str, preferences: List[str]) -> bool:
+        """Return True if the cell already has a decision for this preference set."""
+        return (cell, self.preferences_key(preferences)) in self._decisions
+
+    def stats(self) -> Dict[str, Any]:
+        """Return index size and lookup counters."""
+        total = self.hits + self.misses
+        return {
+            "places": len(self._places),
+            "decisions": len(self._decisions),
+            "precision": self.precision,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+    def close(self) -> None:
+        """Close the index file."""
+        self._conn.close()
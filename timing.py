@@ -0,0 +1,59 @@
+import json
+import time
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Records how long each startup phase takes so cold-start regressions are visible."""
+
+    def __init__(self, started_at: Optional[float] = None):
+        """Start the clock, optionally from an earlier time.perf_counter() reading."""
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases: List[Dict[str, Any]] = []
+        self.ready_at: Optional[float] = None
+
+    @contextmanager
+    def phase(self, name: str):
+        """Time the enclosed block as a named phase."""
+        phase_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, phase_start)
+
+    def record(self, name: str, phase_start: float, phase_end: Optional[float] = None) -> None:
+        """Record a phase that was timed by hand, such as module imports."""
+        phase_end = phase_end if phase_end is not None else time.perf_counter()
+        self.phases.append({
+            "name": name,
+            "start_ms": round((phase_start - self.started_at) * 1000, 2),
+            "duration_ms": round((phase_end - phase_start) * 1000, 2)
+        })
+
+    def mark_ready(self) -> None:
+        """Record the moment the app can serve its first request."""
+        self.ready_at = time.perf_counter()
+
+    def report(self) -> Dict[str, Any]:
+        """Return the phase timings and the total time to ready."""
+        return {
+            "phases": list(self.phases),
+            "time_to_ready_ms": round((self.ready_at - self.started_at) * 1000, 2) if self.ready_at else None
+        }
+
+    def log_report(self, path: Optional[str] = None) -> None:
+        """Log the report and, when a path is given, write it as JSON for run-to-run comparison."""
+        report = self.report()
+        summary = ", ".join(f"{p['name']}={p['duration_ms']}ms" for p in report["phases"])
+        logger.info(f"Startup timing: {summary}; ready after {report['time_to_ready_ms']}ms")
+        if path:
+            try:
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(report, f, indent=2)
+            except OSError as e:
+                logger.error(f"Failed to write startup report to {path}: {str(e)}")